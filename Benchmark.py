@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Benchmark các thuật toán tìm đường (chạy không cần giao diện):
+
+    python Benchmark.py
+"""
+
+import random
+import time
+import tracemalloc
+from collections import deque
+
+import Search
+from Board import BitBoard, Board
+from Search import SearchAlgorithms
+from Solver import BeamPlanner, Solver
+
+SIZES = [(8, 8), (10, 12), (40, 40)]
+BITBOARD_SIZES = [(8, 8), (10, 12), (32, 32), (64, 64)]
+
+
+def make_board(rows, cols, clear_ratio=0.8, seed=0, board_cls=Board):
+    """Tạo bảng ngẫu nhiên rồi xóa bớt một phần ô để có khoảng trống cho việc tìm đường."""
+    random.seed(seed)
+    board = board_cls(rows, cols, list(range(15)))
+    board.new_board()
+    cells = board.get_cells()
+    random.shuffle(cells)
+    for r, c in cells[:int(len(cells) * clear_ratio)]:
+        board.board[r][c] = -1
+    return board
+
+
+def sample_pairs(board, count=30):
+    """Các cặp cùng icon xa nhau nhất (tìm đường tốn kém nhất)."""
+    cells = board.get_cells()
+    pairs = [(a, b) for i, a in enumerate(cells) for b in cells[i + 1:]
+             if board.board[a[0]][a[1]] == board.board[b[0]][b[1]]]
+    pairs.sort(key=lambda p: abs(p[0][0] - p[1][0]) + abs(p[0][1] - p[1][1]), reverse=True)
+    return pairs[:count]
+
+
+def legacy_bfs(algos, start, goal):
+    """BFS kiểu cũ: mỗi phần tử frontier mang bản sao path và gọi lại count_turns (để so sánh)."""
+    queue = deque([(start, [start], 0)])
+    visited = set()
+    while queue:
+        (r, c), path, turns = queue.popleft()
+        if (r, c) in visited:
+            continue
+        visited.add((r, c))
+        if (r, c) == goal and algos.count_turns(path) <= 2:
+            return path
+        for nr, nc, dr, dc in algos.neighbors(r, c):
+            if algos.board[nr][nc] == -1 or (nr, nc) == goal:
+                new_path = path + [(nr, nc)]
+                new_turns = algos.count_turns(new_path)
+                if new_turns <= 2:
+                    queue.append(((nr, nc), new_path, new_turns))
+    return None
+
+
+def measure(fn, pairs):
+    """Trả về (bộ nhớ cấp phát đỉnh trung bình KiB, thời gian trung bình ms) cho mỗi lần tìm."""
+    start_time = time.perf_counter()
+    for start, goal in pairs:
+        fn(start, goal)
+    elapsed = (time.perf_counter() - start_time) * 1000
+    peak_total = 0
+    for start, goal in pairs:
+        tracemalloc.start()
+        fn(start, goal)
+        peak_total += tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    count = max(len(pairs), 1)
+    return peak_total / 1024 / count, elapsed / count
+
+
+def bench_allocations():
+    print("== Path copies vs parent array (peak KiB / ms per search) ==")
+    for rows, cols in SIZES:
+        board = make_board(rows, cols)
+        algos = SearchAlgorithms(board.board, rows, cols)
+        pairs = sample_pairs(board)
+        before = measure(lambda s, g: legacy_bfs(algos, s, g), pairs)
+        after = measure(algos.bfs, pairs)
+        print(f"{rows}x{cols}: before {before[0]:8.1f} KiB {before[1]:7.2f} ms | "
+              f"after {after[0]:8.1f} KiB {after[1]:7.2f} ms")
+
+
+def list_segment_clear(grid, a, b):
+    """Kiểm tra đoạn thẳng trống kiểu cũ: duyệt từng ô của list-of-lists."""
+    (r1, c1), (r2, c2) = a, b
+    if r1 == r2:
+        return all(grid[r1][c] == -1 for c in range(min(c1, c2) + 1, max(c1, c2)))
+    if c1 == c2:
+        return all(grid[r][c1] == -1 for r in range(min(r1, r2) + 1, max(r1, r2)))
+    return False
+
+
+def bench_bitboard():
+    print("== list-of-lists vs Board pointers vs BitBoard masks (us per call) ==")
+    for rows, cols in BITBOARD_SIZES:
+        board = make_board(rows, cols)
+        bits = make_board(rows, cols, board_cls=BitBoard)
+        lists = [row[:] for row in board.board]
+        random.seed(1)
+        segments = []
+        for _ in range(2000):
+            r, c1, c2 = random.randrange(rows), random.randrange(cols), random.randrange(cols)
+            segments.append(((r, c1), (r, c2)))
+            c, r1, r2 = random.randrange(cols), random.randrange(rows), random.randrange(rows)
+            segments.append(((r1, c), (r2, c)))
+        indexed = [(board.index(*a), board.index(*b)) for a, b in segments]
+
+        def timed(fn, items):
+            start_time = time.perf_counter()
+            for a, b in items:
+                fn(a, b)
+            return (time.perf_counter() - start_time) * 1e6 / len(items)
+
+        seg = (timed(lambda a, b: list_segment_clear(lists, a, b), segments),
+               timed(board.segment_clear, indexed), timed(bits.segment_clear, indexed))
+        pairs = list(board.candidate_pairs())[:2000]
+        ray = (timed(SearchAlgorithms(board.board, rows, cols).ray_path, pairs),
+               timed(SearchAlgorithms(bits.board, rows, cols).ray_path, pairs))
+        print(f"{rows}x{cols}: segment list {seg[0]:6.2f} | pointers {seg[1]:6.2f} | bits {seg[2]:6.2f}"
+              f"   ray_path pointers {ray[0]:6.1f} | bits {ray[1]:6.1f}")
+
+
+def fuzz_board(seed):
+    """Bảng ngẫu nhiên cỡ 1x2..10x12, số icon và tỉ lệ ô trống ngẫu nhiên (corpus kiểm tra engine)."""
+    random.seed(seed)
+    rows, cols = random.randint(1, 10), random.randint(1, 12)
+    cols += rows * cols % 2
+    board = Board(rows, cols, list(range(random.randint(1, 15))))
+    board.new_board()
+    cells = board.get_cells()
+    random.shuffle(cells)
+    for r, c in cells[:int(len(cells) * random.random())]:
+        board.board[r][c] = -1
+    return board
+
+
+def check_batch_engine(seeds=range(400)):
+    """Engine Batch trên corpus ngẫu nhiên: so với ray_connect (có và không có NumPy), bfs01 và bfs.
+
+    Batch phải trả về đúng các điểm góc của ray_connect và nối được đúng các cặp bfs01 nối được.
+    bfs đánh dấu visited theo ô (không theo hướng / số lần rẽ) nên bỏ sót một số cặp và đôi khi
+    trả về đường dài hơn; với các cặp bfs tìm được, đường của Batch không được dài hơn.
+    Trả về True nếu mọi kiểm tra đều khớp.
+    """
+    print("== Batch engine vs ray_connect / bfs01 / bfs on a fuzz corpus (mismatches) ==")
+    saved_np = Search.np
+    pairs_total = ray_diff = plain_diff = bfs01_diff = bfs_shorter = bfs_missed = 0
+    try:
+        for seed in seeds:
+            board = fuzz_board(seed)
+            algos = SearchAlgorithms(board.board, board.rows, board.cols)
+            pairs = list(board.candidate_pairs())
+            Search.np = saved_np
+            batch = algos.batch_connect(pairs)
+            Search.np = None
+            plain = algos.batch_connect(pairs)
+            Search.np = saved_np
+            for (start, goal), corners, fallback in zip(pairs, batch, plain):
+                pairs_total += 1
+                ray_diff += corners != algos.ray_connect(start, goal)
+                plain_diff += corners != fallback
+                bfs01_diff += (corners is None) != (algos.bfs01(start, goal) is None)
+                path = algos.bfs(start, goal)
+                if path is None:
+                    bfs_missed += corners is not None
+                elif corners is None or len(algos.corners_to_path(corners)) > len(path):
+                    bfs_shorter += 1
+    finally:
+        Search.np = saved_np
+    print(f"{pairs_total} pairs (NumPy {'on' if saved_np is not None else 'missing'}): "
+          f"ray_connect {ray_diff} | without NumPy {plain_diff} | bfs01 {bfs01_diff} | "
+          f"bfs shorter {bfs_shorter} | pairs only bfs misses {bfs_missed}")
+    return ray_diff == plain_diff == bfs01_diff == bfs_shorter == 0
+
+
+def bench_astar_pruning(seeds=range(20), ratios=(0.3, 0.5, 0.8)):
+    """Số nút của A* khi chỉ dùng khoảng cách Manhattan và khi cắt thêm theo số lần rẽ còn thiếu."""
+    print("== A* Manhattan only vs turn-aware pruning (visited / generated, sum over corpus) ==")
+    for rows, cols in SIZES:
+        totals = {False: [0, 0, 0], True: [0, 0, 0]}
+        for seed in seeds:
+            for ratio in ratios:
+                board = make_board(rows, cols, ratio, seed)
+                algos = SearchAlgorithms(board.board, rows, cols)
+                pairs = list(board.candidate_pairs())[:300]
+                for pruning in (False, True):
+                    algos.turn_pruning = pruning
+                    total = totals[pruning]
+                    for start, goal in pairs:
+                        if algos.astar(start, goal):
+                            total[2] += 1
+                        total[0] += algos.stats['visited']
+                        total[1] += algos.stats['generated']
+        (v0, g0, f0), (v1, g1, f1) = totals[False], totals[True]
+        print(f"{rows}x{cols}: visited {v0} -> {v1} ({1 - v1 / max(v0, 1):.0%} fewer) | "
+              f"generated {g0} -> {g1} ({1 - g1 / max(g0, 1):.0%} fewer) | found {f0} -> {f1}")
+
+
+def bench_solver(sizes=((8, 8), (8, 12), (10, 12), (16, 16)), seeds=range(20)):
+    """Solver trên các bảng mới: số bảng xóa sạch được, số nút DFS, số lần trúng bảng chuyển vị."""
+    print("== Full-board solver (boards per result / nodes / TT hits / ms per board) ==")
+    for rows, cols in sizes:
+        results, nodes, hits = {}, 0, 0
+        start_time = time.perf_counter()
+        for seed in seeds:
+            board = make_board(rows, cols, 0, seed)
+            solver = Solver(board)
+            solver.solve()
+            results[solver.stats['result']] = results.get(solver.stats['result'], 0) + 1
+            nodes += solver.stats['nodes']
+            hits += solver.stats['tt_hits']
+        elapsed = (time.perf_counter() - start_time) * 1000 / len(seeds)
+        print(f"{rows}x{cols}: {results} | nodes {nodes} | tt_hits {hits} | {elapsed:7.1f} ms")
+
+
+def bench_board_generation(sizes=((8, 12), (10, 12), (16, 16), (20, 20), (32, 32)), seeds=range(20)):
+    """Thời gian Board.new_board: xáo ngẫu nhiên và xếp chắc chắn xóa sạch được (solvable=True)."""
+    print("== new_board random vs solvable (ms per board, mean / worst) ==")
+    for rows, cols in sizes:
+        board = Board(rows, cols, list(range(15)))
+        times = {False: [], True: []}
+        for solvable in (False, True):
+            for seed in seeds:
+                random.seed(seed)
+                start_time = time.perf_counter()
+                board.new_board(solvable)
+                times[solvable].append((time.perf_counter() - start_time) * 1000)
+        (plain, solvable) = times[False], times[True]
+        print(f"{rows}x{cols}: random {sum(plain) / len(plain):6.2f} / {max(plain):6.2f} | "
+              f"solvable {sum(solvable) / len(solvable):6.2f} / {max(solvable):6.2f}")
+
+
+def board_copy(board):
+    copy = BitBoard(board.rows, board.cols, board.icons)
+    copy.board = board.board
+    return copy
+
+
+def scan_order_cost(board):
+    """Tổng cost khi luôn xóa cặp nối được đầu tiên theo thứ tự quét (như find_pair), đường ngắn nhất."""
+    board = board_copy(board)
+    algos = SearchAlgorithms(board.board, board.rows, board.cols)
+    cost = 0
+    while True:
+        for start, goal in board.candidate_pairs():
+            corners = algos.ray_connect(start, goal)
+            if corners:
+                break
+        else:
+            return cost, len(board.get_cells())
+        cost += sum(abs(r1 - r2) + abs(c1 - c2) for (r1, c1), (r2, c2) in zip(corners, corners[1:]))
+        board.remove_pair(*start, *goal)
+
+
+def bench_beam_planner(sizes=((8, 8), (8, 12), (10, 12)), widths=(1, 4, 8), seeds=range(10)):
+    """Tổng cost cả ván (trung bình trên các bảng xóa sạch được): thứ tự quét và BeamPlanner."""
+    print("== Removal order cost: scan order vs BeamPlanner (mean cost / boards cleared / ms) ==")
+    for rows, cols in sizes:
+        boards = []
+        for seed in seeds:
+            random.seed(seed)
+            board = Board(rows, cols, list(range(15)))
+            board.new_board(solvable=True)
+            boards.append(board)
+        scans = [scan_order_cost(board) for board in boards]
+        cleared = [cost for cost, left in scans if not left]
+        line = f"{rows}x{cols}: scan {sum(cleared) / max(len(cleared), 1):6.1f} / {len(cleared)}"
+        for width in widths:
+            cleared, elapsed = [], 0
+            for board in boards:
+                planner = BeamPlanner(board, width, time_budget=60)
+                planner.plan()
+                if planner.stats['result'] == 'complete':
+                    cleared.append(planner.stats['cost'])
+                elapsed += planner.stats['time_ms']
+            line += (f" | beam {width}: {sum(cleared) / max(len(cleared), 1):6.1f} / {len(cleared)}"
+                     f" / {elapsed / len(boards):5.0f} ms")
+        print(line)
+
+
+def main():
+    check_batch_engine()
+    bench_allocations()
+    bench_bitboard()
+    bench_astar_pruning()
+    bench_solver()
+    bench_board_generation()
+    bench_beam_planner()
+
+
+if __name__ == "__main__":
+    main()
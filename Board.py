@@ -1,40 +1,411 @@
 import random
+from array import array
+from bisect import bisect_right
+
+EMPTY = -1   # ô trống (đã ăn)
+BORDER = -2  # ô canh biên bao quanh bảng, không bao giờ đi qua được
+
+
+class RowView:
+    """Một hàng của bảng phẳng, dùng được như list: row[c], row[c] = v, row[:]."""
+    __slots__ = ('_board', '_r', '_base', '_cols')
+
+    def __init__(self, board, r):
+        self._board = board
+        self._r = r
+        self._base = (r + 1) * board.width + 1
+        self._cols = board.cols
+
+    def __len__(self):
+        return self._cols
+
+    def __getitem__(self, c):
+        if isinstance(c, slice):
+            grid, base = self._board.grid, self._base
+            return [grid[base + i] for i in range(*c.indices(self._cols))]
+        if c < 0:
+            c += self._cols
+        if not 0 <= c < self._cols:
+            raise IndexError("board column out of range")
+        return self._board.grid[self._base + c]
+
+    def __setitem__(self, c, value):
+        if c < 0:
+            c += self._cols
+        if not 0 <= c < self._cols:
+            raise IndexError("board column out of range")
+        self._board.set_cell(self._r, c, value)
+
+    def __iter__(self):
+        grid, base = self._board.grid, self._base
+        return (grid[base + i] for i in range(self._cols))
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class BoardView(list):
+    """View tương thích list-of-lists (board[r][c]) của bảng phẳng, dùng cho code vẽ giao diện.
+
+    Các thuật toán tìm đường đọc thẳng grid/width/offsets thay vì đi qua từng hàng.
+    """
+
+    def __init__(self, board):
+        super().__init__(RowView(board, r) for r in range(board.rows))
+        self.owner = board
+        self.grid = board.grid
+        self.width = board.width
+        self.offsets = board.offsets
+
 
 class Board:
     def __init__(self, rows, cols, icons):
         self.rows = rows
         self.cols = cols
         self.icons = icons
-        self.board = []
+        # Bảng phẳng có một vòng ô canh BORDER: ô (r, c) nằm ở chỉ số (r + 1) * width + (c + 1)
+        self.width = cols + 2
+        self.grid = array('b', [BORDER]) * ((rows + 2) * self.width)
+        # Độ dời tới ô kề theo thứ tự hướng của SearchAlgorithms.DIRECTIONS: xuống, lên, phải, trái
+        self.offsets = (self.width, -self.width, 1, -1)
+        self.cells = [self.index(r, c) for r in range(rows) for c in range(cols)]
+        for i in self.cells:
+            self.grid[i] = EMPTY
+        # icon -> tập chỉ số ô đang chứa icon đó, cập nhật cùng mọi thay đổi của bảng
+        self.icon_cells = {}
+        # generation tăng khi bảng bị thay đổi hàng loạt; removed ghi các ô bị xóa từ lần đó,
+        # để các bộ nhớ đệm (vd. MoveCache) tự đồng bộ lại
+        self.generation = 0
+        self.removed = []
+        # nearest[d][i]: ô có icon (hoặc viền) gần nhất theo hướng d tính từ i, d theo thứ tự offsets.
+        # Với ô có icon con trỏ luôn đúng (danh sách liên kết theo hàng/cột); với ô trống con trỏ có
+        # thể trỏ vào ô đã bị xóa và được rút gọn dần khi tra cứu (như union-find).
+        self._init_links()
+        self._view = BoardView(self)
+
+    @property
+    def board(self):
+        return self._view
+
+    @board.setter
+    def board(self, rows):
+        """Nạp lại bảng từ list-of-lists (vd. khi khôi phục bảng ban đầu)."""
+        for r, row in enumerate(rows):
+            base = self.index(r, 0)
+            for c, value in enumerate(row):
+                self.grid[base + c] = value
+        self._rebuild_index()
+
+    def index(self, r, c):
+        return (r + 1) * self.width + c + 1
+
+    def position(self, i):
+        r, c = divmod(i, self.width)
+        return r - 1, c - 1
+
+    def _rebuild_index(self):
+        grid = self.grid
+        self.generation += 1
+        self.removed = []
+        self.icon_cells = {}
+        for i in self.cells:
+            if grid[i] != EMPTY:
+                self.icon_cells.setdefault(grid[i], set()).add(i)
+        self._rebuild_links()
+
+    def _init_links(self):
+        self.nearest_links = [array('i', [0]) * len(self.grid) for _ in range(4)]
+
+    def _rebuild_links(self):
+        grid = self.grid
+        for d, offset in enumerate(self.offsets):
+            links = self.nearest_links[d]
+            # duyệt ngược chiều offset để ô phía trước luôn được tính xong trước
+            order = range(len(grid) - 1, -1, -1) if offset > 0 else range(len(grid))
+            for i in order:
+                n = i + offset
+                if 0 <= n < len(grid):
+                    links[i] = n if grid[n] != EMPTY else links[n]
+                else:
+                    links[i] = i
+
+    def _unlink(self, i):
+        """Gỡ ô i (vừa thành trống) khỏi danh sách liên kết hàng/cột trong O(1)."""
+        links = self.nearest_links
+        for d in (0, 2):
+            after, before = links[d][i], links[d + 1][i]
+            links[d][before] = after
+            links[d + 1][after] = before
 
-    def new_board(self):
+    def _link(self, i):
+        """Chèn ô i (vừa có icon trở lại) vào danh sách liên kết hàng/cột của nó.
+
+        Chỉ các ô trống nằm giữa i và ô có icon gần nhất phía sau i (theo từng hướng d) có thể đang
+        trỏ vượt qua i, nên chỉ đoạn đó được trỏ lại về i: O(độ dài hàng + cột) thay vì cả bảng.
+        """
+        grid, links = self.grid, self.nearest_links
+        ahead = [self.nearest(i, d) for d in range(4)]
+        for d, offset in enumerate(self.offsets):
+            links[d][i] = ahead[d]
+            j = i - offset
+            while grid[j] == EMPTY:
+                links[d][j] = i
+                j -= offset
+            links[d][j] = i  # ô có icon (hoặc viền) liền trước i
+
+    def nearest(self, i, d):
+        """Chỉ số ô có icon (hoặc viền) gần nhất theo hướng d tính từ i, không tính chính i."""
+        grid, links = self.grid, self.nearest_links[d]
+        j = links[i]
+        if grid[j] != EMPTY:
+            return j
+        while grid[j] == EMPTY:
+            j = links[j]
+        while grid[links[i]] == EMPTY:   # rút gọn đường đi
+            nxt = links[i]
+            links[i] = j
+            i = nxt
+        return j
+
+    def segment_clear(self, a, b):
+        """True nếu a, b cùng hàng/cột và mọi ô nằm giữa (không tính hai đầu) đều trống."""
+        if a == b:
+            return True
+        if a // self.width == b // self.width:
+            d = 2 if b > a else 3
+        elif (b - a) % self.width == 0:
+            d = 0 if b > a else 1
+        else:
+            return False
+        n = self.nearest(a, d)
+        return n >= b if b > a else n <= b
+
+    def set_cell(self, r, c, value):
+        i = self.index(r, c)
+        old = self.grid[i]
+        if old != EMPTY:
+            self.icon_cells[old].discard(i)
+        if value != EMPTY:
+            self.icon_cells.setdefault(value, set()).add(i)
+        self.grid[i] = value
+        self.generation += 1
+        self.removed = []
+        if old != EMPTY and value == EMPTY:
+            self._unlink(i)
+        elif old == EMPTY and value != EMPTY:
+            self._link(i)
+
+    def new_board(self, solvable=False):
+        """Xếp bảng mới, mỗi icon xuất hiện một số chẵn lần.
+
+        solvable=True: chọn trước một thứ tự xóa phủ kín bảng (_removal_order) rồi mới gán icon
+        cho từng cặp, nên bảng luôn xóa sạch được mà không cần reshuffle.
+        """
         total = self.rows * self.cols
-        icons = [i % len(self.icons) for i in range(total // 2)] * 2
-        random.shuffle(icons)
-        self.board = [[icons.pop() for _ in range(self.cols)] for _ in range(self.rows)]
+        if solvable:
+            icons = [i % len(self.icons) for i in range(total // 2)]
+            random.shuffle(icons)
+            for (a, b), icon in zip(self._removal_order(), icons):
+                self.grid[a] = self.grid[b] = icon
+        else:
+            icons = [i % len(self.icons) for i in range(total // 2)] * 2
+            random.shuffle(icons)
+            for i in self.cells:
+                self.grid[i] = icons.pop()
+        self._rebuild_index()
         return self.board
 
+    def _removal_order(self):
+        """Thứ tự xóa ngẫu nhiên [(a, b), ...] trên bảng đầy: mỗi cặp nối được khi tới lượt.
+
+        Ghép cặp theo chiều xóa xuôi chứ không đặt ngược từ bảng trống: đặt ngược thì hai ô cuối
+        cùng phải kề nhau trên bảng gần đầy nên hầu như luôn bí, còn đi xuôi thì bảng càng về sau
+        càng trống. Chỉ dùng hình dạng bảng; grid bị ghi đè (ô còn lại = 0, ô đã xóa = EMPTY).
+        """
+        grid = self.grid
+        while True:
+            for i in self.cells:
+                grid[i] = 0
+            remaining = list(self.cells)
+            order = []
+            while len(remaining) > 1:
+                random.shuffle(remaining)
+                for a in remaining:
+                    partners = self._reachable_tiles(a)
+                    if partners:
+                        break
+                else:
+                    break  # không còn cặp nào nối được (rất hiếm): làm lại từ đầu
+                b = random.choice(sorted(partners))
+                grid[a] = grid[b] = EMPTY
+                remaining.remove(a)
+                remaining.remove(b)
+                order.append((a, b))
+            if len(remaining) <= 1:
+                for i in remaining:
+                    grid[i] = EMPTY
+                return order
+
+    def _reachable_tiles(self, a):
+        """Các ô có icon (bất kể icon gì) nối được với a bằng đường ≤2 lần rẽ qua các ô trống."""
+        grid, offsets = self.grid, self.offsets
+        tiles = set()
+        frontier = [(a, -1)]
+        for _ in range(3):  # mỗi vòng đi thẳng một đoạn, đổi trục ở đầu vòng sau
+            next_frontier = []
+            for i, axis in frontier:
+                for d, offset in enumerate(offsets):
+                    if d >> 1 == axis:
+                        continue
+                    n = i + offset
+                    while grid[n] == EMPTY:
+                        next_frontier.append((n, d >> 1))
+                        n += offset
+                    if grid[n] != BORDER and n != a:
+                        tiles.add(n)
+            frontier = next_frontier
+        return tiles
+
     def remove_pair(self, r1, c1, r2, c2):
-        self.board[r1][c1] = self.board[r2][c2] = -1
+        for i in (self.index(r1, c1), self.index(r2, c2)):
+            icon = self.grid[i]
+            if icon != EMPTY:
+                self.icon_cells[icon].discard(i)
+                self.grid[i] = EMPTY
+                self._unlink(i)
+            self.removed.append(i)
+
+    def candidate_pairs(self):
+        """Các cặp ô cùng icon theo đúng thứ tự của vòng lặp quét mọi cặp ô trước đây,
+        nhưng chỉ duyệt trong nhóm icon của từng ô."""
+        grid = self.grid
+        buckets = {icon: sorted(cells) for icon, cells in self.icon_cells.items()}
+        for a in self.cells:
+            icon = grid[a]
+            if icon == EMPTY:
+                continue
+            bucket = buckets[icon]
+            for b in bucket[bisect_right(bucket, a):]:
+                yield self.position(a), self.position(b)
 
     def get_cells(self):
-        coords = []
-        for r in range(self.rows):
-            for c in range(self.cols):
-                if self.board[r][c] != -1:
-                    coords.append((r, c))
-        return coords
-
-    def reshuffle_remaining(self):
-        remaining_positions = []
-        remaining_values = []
-        for r in range(self.rows):
-            for c in range(self.cols):
-                if self.board[r][c] != -1:
-                    remaining_positions.append((r, c))
-                    remaining_values.append(self.board[r][c])
+        grid = self.grid
+        return [self.position(i) for i in self.cells if grid[i] != EMPTY]
+
+    def reshuffle_remaining(self, guaranteed=0):
+        """Xáo lại các icon còn lại trên đúng các ô đang có icon.
+
+        guaranteed > 0: sau khi xáo, đặt thêm tối đa guaranteed cặp cùng icon nhìn thẳng thấy nhau
+        (cùng hàng/cột, ở giữa toàn ô trống) nên chắc chắn còn nước đi mà không cần tìm lại.
+        Trả về số cặp đã đặt được.
+        """
+        grid = self.grid
+        remaining_positions = [i for i in self.cells if grid[i] != EMPTY]
         if not remaining_positions:
-            return
+            return 0
+        remaining_values = [grid[i] for i in remaining_positions]
         random.shuffle(remaining_values)
-        for idx, (r, c) in enumerate(remaining_positions):
-            self.board[r][c] = remaining_values[idx]
\ No newline at end of file
+        for i, value in zip(remaining_positions, remaining_values):
+            grid[i] = value
+        # các ô trống không đổi nên con trỏ nearest / bitmask vẫn đúng trước khi dựng lại chỉ mục
+        planted = self._plant_pairs(remaining_positions, guaranteed) if guaranteed else 0
+        self._rebuild_index()
+        return planted
+
+    def _plant_pairs(self, cells, count):
+        """Đổi chỗ icon để tối đa count cặp ô nhìn thẳng thấy nhau có cùng icon.
+
+        Mỗi cặp là một ô a và ô có icon gần nhất phía dưới / bên phải của nó (b); icon của a được
+        đưa vào b bằng cách đổi b với một ô c khác cùng icon với a, nên số lượng mỗi icon giữ nguyên.
+        Nếu không có hai ô nào chung hàng/cột thì mọi ô nằm ở hàng và cột riêng, khi đó hai ô bất kỳ
+        nối được qua góc chữ L (góc và hai cạnh đều trống), nên vẫn còn nước đi.
+        """
+        grid = self.grid
+        order = cells[:]
+        random.shuffle(order)
+        used = set()
+        planted = 0
+        for a in order:
+            if planted == count:
+                break
+            if a in used:
+                continue
+            for d in (0, 2):
+                b = self.nearest(a, d)
+                if grid[b] == BORDER or b in used:
+                    continue
+                icon = grid[a]
+                if grid[b] != icon:
+                    c = next((c for c in cells if grid[c] == icon and c != a and c not in used), None)
+                    if c is None:
+                        continue
+                    grid[b], grid[c] = grid[c], grid[b]
+                used.update((a, b))
+                planted += 1
+                break
+        return planted
+
+
+class BitBoard(Board):
+    """Board lưu trạng thái trống bằng bitmask: một số nguyên cho mỗi hàng và mỗi cột.
+
+    Bit k của row_bits[R] bật khi ô (R, k) của bảng phẳng (tính cả viền) đang trống, tương tự
+    col_bits[k] theo hàng. Kiểm tra một đoạn thẳng trống chỉ còn một phép AND và so sánh,
+    tìm ô có icon gần nhất là một phép tìm bit thấp/cao nhất, thay cho các con trỏ của Board.
+    """
+
+    def _init_links(self):
+        self.row_bits = [0] * (self.rows + 2)
+        self.col_bits = [0] * self.width
+
+    def _rebuild_links(self):
+        grid, width = self.grid, self.width
+        self.row_bits = [0] * (self.rows + 2)
+        self.col_bits = [0] * width
+        for i in self.cells:
+            if grid[i] == EMPTY:
+                r, c = divmod(i, width)
+                self.row_bits[r] |= 1 << c
+                self.col_bits[c] |= 1 << r
+
+    def _unlink(self, i):
+        r, c = divmod(i, self.width)
+        self.row_bits[r] |= 1 << c
+        self.col_bits[c] |= 1 << r
+
+    def _link(self, i):
+        r, c = divmod(i, self.width)
+        self.row_bits[r] &= ~(1 << c)
+        self.col_bits[c] &= ~(1 << r)
+
+    def nearest(self, i, d):
+        r, c = divmod(i, self.width)
+        if d < 2:
+            occupied, k, step = ~self.col_bits[c], r, self.width
+        else:
+            occupied, k, step = ~self.row_bits[r], c, 1
+        if d % 2 == 0:
+            # bit có icon thấp nhất phía trên k (viền luôn là bit có icon nên luôn tồn tại)
+            above = occupied >> (k + 1)
+            return i + ((above & -above).bit_length()) * step
+        # bit có icon cao nhất phía dưới k
+        return i - (k - (occupied & ((1 << k) - 1)).bit_length() + 1) * step
+
+    def segment_clear(self, a, b):
+        if a == b:
+            return True
+        if a > b:
+            a, b = b, a
+        r1, c1 = divmod(a, self.width)
+        r2, c2 = divmod(b, self.width)
+        if r1 == r2:
+            bits, lo, hi = self.row_bits[r1], c1, c2
+        elif c1 == c2:
+            bits, lo, hi = self.col_bits[c1], r1, r2
+        else:
+            return False
+        mask = ((1 << (hi - lo - 1)) - 1) << (lo + 1)
+        return bits & mask == mask
@@ -0,0 +1,125 @@
+"""
+Kho bảng dựng sẵn cho New Game (chạy không cần giao diện):
+
+    pool = BoardPool("board_pool.json")
+    rows_of_icons = pool.pop(10, 12, 15)   # None nếu kho của cỡ này đang rỗng
+"""
+
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+from Board import Board, EMPTY
+
+BOARD_POOL_SIZE = 5                # số bảng giữ sẵn cho mỗi (rows, cols, số icon)
+BOARD_POOL_FILE = "board_pool.json"  # đặt cạnh history.json
+
+
+class BoardPool:
+    """Các bảng chắc chắn xóa sạch được (Board.new_board(solvable=True)) xếp sẵn theo cỡ.
+
+    pop() lấy một bảng ngay lập tức rồi bổ sung kho bằng một luồng nền; kho được ghi ra đĩa
+    sau mỗi lần bổ sung nên lần mở game sau cũng có sẵn bảng.
+    """
+
+    def __init__(self, path, size=BOARD_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()  # chỉ một luồng ghi board_pool.json (cùng file .tmp) mỗi lúc
+        self.pools = self._load()  # "rowsxcolsxicons" -> [bảng list-of-lists, ...]
+        self.filling = set()       # các khóa đang có luồng nền bổ sung
+
+    @staticmethod
+    def _key(rows, cols, icons):
+        return f"{rows}x{cols}x{icons}"
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                pools = json.load(f)
+        except Exception:
+            return {}
+        # bỏ các bảng không hợp lệ với cỡ / số icon ghi trong khóa (file bị sửa tay hoặc hỏng)
+        valid = {}
+        if not isinstance(pools, dict):
+            return valid
+        for key, boards in pools.items():
+            try:
+                rows, cols, icons = map(int, key.split("x"))
+            except (AttributeError, ValueError):
+                continue
+            if not isinstance(boards, list):
+                continue
+            valid[key] = [board for board in boards if self._valid(board, rows, cols, icons)]
+        return valid
+
+    @staticmethod
+    def _valid(board, rows, cols, icons):
+        """True nếu board là rows x cols ô EMPTY hoặc icon 0..icons-1, mỗi icon xuất hiện chẵn lần
+        (số lẻ thì không bao giờ xóa sạch được)."""
+        if not isinstance(board, list) or len(board) != rows:
+            return False
+        counts = Counter()
+        for row in board:
+            if not isinstance(row, list) or len(row) != cols:
+                return False
+            for cell in row:
+                if type(cell) is not int or not (cell == EMPTY or 0 <= cell < icons):
+                    return False
+                counts[cell] += 1
+        return all(count % 2 == 0 for cell, count in counts.items() if cell != EMPTY)
+
+    def _save(self):
+        # chụp kho trong lock, ghi đĩa ngoài lock để pop() ở luồng giao diện không phải chờ I/O
+        with self.save_lock:
+            with self.lock:
+                data = json.dumps(self.pools)
+            try:
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp_path, self.path)
+            except Exception:
+                pass
+
+    def pop(self, rows, cols, icons):
+        """Một bảng list-of-lists lấy khỏi kho, hoặc None nếu kho cỡ này rỗng; kho luôn được bổ sung ở nền."""
+        with self.lock:
+            boards = self.pools.get(self._key(rows, cols, icons))
+            board = boards.pop() if boards else None
+        self.refill(rows, cols, icons)
+        return board
+
+    def refill(self, rows, cols, icons):
+        """Bổ sung kho cỡ này tới size bảng trong một luồng nền; bỏ qua nếu đang có luồng làm việc đó."""
+        key = self._key(rows, cols, icons)
+        with self.lock:
+            if key in self.filling or len(self.pools.get(key, ())) >= self.size:
+                return None
+            self.filling.add(key)
+        worker = threading.Thread(target=self._fill, args=(rows, cols, icons), daemon=True)
+        worker.start()
+        return worker
+
+    def _fill(self, rows, cols, icons):
+        key = self._key(rows, cols, icons)
+        board = Board(rows, cols, list(range(icons)))
+        try:
+            while True:
+                with self.lock:
+                    if len(self.pools.setdefault(key, [])) >= self.size:
+                        break
+                time.sleep(0)  # nhường GIL để luồng giao diện (vd. new_game vừa pop) chạy trước
+                board.new_board(solvable=True)
+                rows_of_icons = [row[:] for row in board.board]
+                with self.lock:
+                    self.pools[key].append(rows_of_icons)
+            self._save()
+        finally:
+            with self.lock:
+                self.filling.discard(key)
@@ -1,5 +1,7 @@
 from Board import Board
-from Search import SearchAlgorithms
+from Search import SearchAlgorithms, MoveCache
+from Solver import PlanWorker
+from BoardPool import BoardPool, BOARD_POOL_FILE
 from UI import GameUI
 import tkinter as tk
 import tkinter.messagebox as messagebox
@@ -12,6 +14,17 @@ from WinScreen import WinScreen
 import hashlib
 
 
+SKIP_MAX_RESHUFFLES = 50  # skip dừng giải nhanh nếu reshuffle liên tiếp chừng này lần vẫn bí
+# Giới hạn đường đi theo chế độ chơi: (số ô tối đa của đường đi hoặc None, số lần rẽ tối đa).
+# DFS/BFS/UCS/A* nhận giới hạn ngay trong lúc tìm nên Auto bỏ qua sớm các cặp có đường quá dài.
+MODE_PATH_LIMITS = {"Manual": (None, 2), "Auto": (6, 2)}
+RESHUFFLE_GUARANTEED_MOVES = 2  # số cặp nối được đặt sẵn mỗi lần reshuffle khi bí
+SOLVABLE_BOARDS = True  # ván mới luôn xóa sạch được không cần reshuffle (Board.new_board(solvable=True))
+# Thứ tự xóa auto play đi theo: "Beam" = BeamPlanner giảm tổng cost (dùng Solver nếu beam không
+# xóa sạch được bảng trong giới hạn thời gian), "Solver" = chỉ cần xóa sạch bảng
+AUTO_PLANNER = "Beam"
+
+
 class PikachuGame:
     def __init__(self, root, rows=8, cols=12):  # Thêm tham số mặc định
         self.root = root
@@ -30,6 +43,8 @@ class PikachuGame:
         self.selected = []
         self.sound_enabled = True
         self.history_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.json")
+        # Bảng xóa sạch được xếp sẵn ở nền cho New Game, cache cạnh history.json
+        self.board_pool = BoardPool(os.path.join(os.path.dirname(self.history_file), BOARD_POOL_FILE))
         self.highlighted_cells = []  # Danh sách các ô đang được highlight
         self.background_revealed = 0
         self.initial_board = None   #lưu bảng ban đầu
@@ -54,6 +69,14 @@ class PikachuGame:
         self.ui = GameUI(root, self.rows, self.cols, self.cell_size, self)
         self.root.geometry("1000x1000")
         self.algorithms = SearchAlgorithms(self.board.board, self.rows, self.cols)
+        self.apply_path_limits()
+        # Các cặp hợp lệ được giữ giữa các lượt, chỉ kiểm tra lại quanh ô vừa xóa
+        self.move_cache = MoveCache(self.algorithms)
+        # Thứ tự xóa plan_worker lập cho bảng ở generation solver_generation, auto play đi theo
+        self.plan_worker = PlanWorker(AUTO_PLANNER)
+        self.solver_plan = None
+        self.solver_generation = None
+        self.current_trace = None  # trace của lần search planned_pair / find_pair vừa chạy (auto play phát lại)
         # Enable debug diagnostics to print neighbor-generation stats (set to False to disable)
         try:
             self.algorithms.debug = True
@@ -108,6 +131,15 @@ class PikachuGame:
         if self.auto_running:
             self.stop_game()
             print(f"[DEBUG] Auto stopped due to mode change to: {mode_value}")
+        if hasattr(self, 'algorithms'):
+            self.apply_path_limits(mode_value)
+
+    def apply_path_limits(self, mode=None):
+        """Đưa giới hạn đường đi của chế độ chơi (MODE_PATH_LIMITS) vào SearchAlgorithms."""
+        if mode is None:
+            mode_var = getattr(self.ui, 'mode_var', None)
+            mode = mode_var.get() if mode_var is not None else "Manual"
+        self.algorithms.set_limits(*MODE_PATH_LIMITS.get(mode, (None, 2)))
 
     def go_to_splash_screen(self):
         """Quay về giao diện SplashScreen và dừng trò chơi hiện tại."""
@@ -163,9 +195,6 @@ class PikachuGame:
         self.clear_highlights()
         self.clear_simulation_highlights()
         self.background_revealed = 0
-        self.board.new_board()
-        self.algorithms.board = self.board.board
-        self.algorithms.reset_simulation()
 
         # Disable skip by default when starting a new game
         try:
@@ -180,7 +209,11 @@ class PikachuGame:
             self.board.board = [row[:] for row in self.initial_board]
             print("Restored initial board:", self.board.board)  # Debug
         else:
-            self.board.new_board()
+            pooled = self.board_pool.pop(self.rows, self.cols, len(self.icons)) if SOLVABLE_BOARDS else None
+            if pooled:
+                self.board.board = pooled
+            else:
+                self.board.new_board(solvable=SOLVABLE_BOARDS)
             self.initial_board = [row[:] for row in self.board.board]  # Cập nhật bảng ban đầu
 
         self.algorithms.board = self.board.board
@@ -285,7 +318,8 @@ class PikachuGame:
 
                 if self.board.board[r1][c1] == self.board.board[r2][c2]:
                     algo = self.ui.algo_var.get()
-                    path = self.get_path((r1, c1), (r2, c2), algo)
+                    # Một lần tìm kiếm cho cả đường đi lẫn visited/generated của nước đi
+                    path, self.current_algorithm_stats, _ = self.algorithms.search((r1, c1), (r2, c2), algo)
                     if path:
                         self.draw_lightning(path)
                         self.root.after(350, lambda: self.remove_pair_and_check(r1, c1, r2, c2, path))
@@ -420,6 +454,16 @@ class PikachuGame:
             path = self.algorithms.astar(start, goal)
         elif algo == "HillClimb":
             path = self.algorithms.hill_climb(start, goal)
+        elif algo == "Ray":
+            path = self.algorithms.ray_path(start, goal)
+        elif algo == "0-1 BFS":
+            path = self.algorithms.bfs01(start, goal)
+        elif algo == "Batch":
+            path = self.algorithms.batch_path(start, goal)
+        elif algo == "Bi-BFS":
+            path = self.algorithms.bibfs(start, goal)
+        elif algo == "Segments":
+            path = self.algorithms.segment_path(start, goal)
         else:
             path = self.algorithms.astar(start, goal)
 
@@ -431,17 +475,92 @@ class PikachuGame:
         self.current_algorithm_stats = self.algorithms.stats.copy()
         return path
 
-    def find_pair(self, algo):
-        coords = self.board.get_cells()
-        for i in range(len(coords)):
-            for j in range(i + 1, len(coords)):
-                r1, c1 = coords[i]
-                r2, c2 = coords[j]
-                if self.board.board[r1][c1] == self.board.board[r2][c2]:
-                    path = self.get_path((r1, c1), (r2, c2), algo)
-                    if path:
-                        return (r1, c1), (r2, c2), path
-        return None
+    def play_search(self, start, goal, algo, trace):
+        """Cho simulate_auto_step phát lại quá trình tìm đường của cặp đã chọn.
+
+        trace: trace của chính lần search đã tìm ra cặp (planned_pair / find_pair với trace=True),
+        nên cặp không bị tìm lại chỉ để lấy hoạt cảnh.
+        """
+        if trace:
+            self.algorithms.play_trace(trace)
+        else:
+            self.algorithms.start_simulation(start, goal, algo)
+
+    def find_pair(self, algo, trace=False):
+        """Cặp nối được đầu tiên theo thứ tự quét: ((r1, c1), (r2, c2), path) hoặc None.
+
+        trace=True: như planned_pair, cặp được chọn bằng search có ghi trace (lưu ở current_trace)
+        để auto play phát lại đúng lần tìm đó.
+        """
+        # MoveCache giữ tập nước đi hợp lệ và chỉ cập nhật quanh các ô vừa xóa: nếu rỗng thì bàn
+        # đã bí, khỏi quét mọi cặp bằng thuật toán đang chọn
+        if not self.move_cache.has_move():
+            return None
+        # Giới hạn độ dài của chế độ chơi áp dụng như nhau cho mọi engine
+        self.apply_path_limits()
+        max_len = self.algorithms.max_len
+        pair = self._first_pair(algo, max_len, trace)
+        if pair is None and max_len is not None:
+            # Không còn cặp nào nối được trong giới hạn độ dài: bỏ giới hạn cho riêng nước này thay
+            # vì reshuffle khi vẫn còn nước đi
+            pair = self._first_pair(algo, None, trace)
+        if pair and trace:
+            *pair, self.current_trace = pair
+            pair = tuple(pair)
+        if pair:
+            self.current_algorithm_stats = self.algorithms.stats.copy()
+        return pair
+
+    def _first_pair(self, algo, max_len, trace):
+        """Cặp đầu tiên theo thứ tự quét mà algo nối được trong max_len ô (kèm trace nếu trace=True)."""
+        if algo == "Ray":
+            # MoveCache giữ sẵn mọi cặp Ray nối được, chỉ còn lọc theo độ dài
+            return self.move_cache.get_move(max_len, trace)
+        return self.algorithms.find_pair(algo, max_len, trace)
+
+    def with_max_len(self, max_len, func, *args, **kwargs):
+        """Gọi func với giới hạn độ dài max_len rồi trả lại giới hạn của chế độ chơi."""
+        saved = self.algorithms.max_len
+        self.algorithms.max_len = max_len
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.algorithms.max_len = saved
+
+    def planned_pair(self, algo, trace=False):
+        """Cặp kế tiếp trong thứ tự xóa của make_plan (xóa sạch bảng không cần reshuffle).
+
+        Lập lại kế hoạch ở nền khi bảng bị thay đổi hàng loạt (ván mới, reshuffle) hoặc cặp kế tiếp
+        đã bị xóa; trả về None khi kế hoạch chưa lập xong hoặc không có, để find_pair chọn cặp như cũ.
+        trace=True: cặp được kiểm tra bằng một lần search có ghi trace (lưu ở current_trace) để
+        auto play phát lại đúng lần tìm đó thay vì tìm lại.
+        """
+        board = self.board.board
+        plan = self.solver_plan if self.solver_generation == self.board.generation else None
+        if plan and any(board[r][c] == -1 for r, c in plan[0]):
+            plan = None
+        if plan is None:
+            # kế hoạch được lập ở luồng nền (plan_worker); trong lúc chờ find_pair chọn cặp như cũ
+            plan = self.plan_worker.take(self.board)
+            if plan is None:
+                self.plan_worker.request(self.board)
+                return None
+            self.solver_plan = plan
+            self.solver_generation = self.board.generation
+        if not plan:
+            return None
+        start, goal = plan[0]
+        # thứ tự xóa đã chứng minh xóa sạch bảng nên được đi cả đường dài hơn giới hạn của chế độ
+        if trace:
+            path, self.current_algorithm_stats, self.current_trace = self.with_max_len(
+                None, self.algorithms.search, start, goal, algo, trace=True)
+        else:
+            path = self.with_max_len(None, self.get_path, start, goal, algo)
+        if not path:
+            plan.clear()  # thuật toán đang chọn không dựng được đường cho cặp này: thôi theo plan
+            return None
+        plan.popleft()
+        return start, goal, path
 
     def draw_lightning(self, path):
         coords = []
@@ -551,12 +670,12 @@ class PikachuGame:
                     r2, c2 = path[-1]
                     self.draw_final_path(path)
                     # wait a bit (configurable) then remove the pair
-                    self.root.after(max(20, int(self.auto_delay_ms)), lambda: self.remove_pair_and_check(r1, c1, r2, c2, path, auto=True))
+                    self.auto_timer = self.root.after(max(20, int(self.auto_delay_ms)), lambda: self.remove_pair_and_check(r1, c1, r2, c2, path, auto=True))
                     return
 
             elif action == "none":
                 self.show_no_path_message()
-                self.root.after(1500, self.continue_auto_play)
+                self.auto_timer = self.root.after(1500, self.continue_auto_play)
                 return
 
             delay = max(10, int(self.auto_delay_ms))
@@ -569,7 +688,7 @@ class PikachuGame:
                 self.set_skip_enabled(False)
             except Exception:
                 pass
-            self.root.after(max(20, int(self.auto_delay_ms // 2)), self.continue_auto_play)
+            self.auto_timer = self.root.after(max(20, int(self.auto_delay_ms // 2)), self.continue_auto_play)
 
     def set_skip_enabled(self, enabled: bool):
         """Enable or disable the Skip button if available."""
@@ -580,38 +699,56 @@ class PikachuGame:
             pass
 
     def skip_simulation(self):
-        """Skip forward: fast-forward the simulation to the next 'goal' step or end."""
-        was_sim = getattr(self.algorithms, 'simulation_mode', False)
-        self.algorithms.simulation_mode = True
+        """Skip: giải nốt bàn chơi ngay, không phát lại trace.
+
+        Các cặp còn lại được tìm và xóa thẳng trên Board (reshuffle khi bí như auto play),
+        rồi canvas, cost và tổng visited/generated được cập nhật một lần ở cuối.
+        """
+        if self.game_won:
+            return
+        if hasattr(self, 'auto_timer'):
+            self.root.after_cancel(self.auto_timer)  # hủy bước simulation / lần xóa cặp / lượt auto đang chờ
+        self.algorithms.reset_simulation()
+        self.clear_simulation_highlights()
+        self.clear_highlights()
         try:
-            while True:
-                step = self.algorithms.simulate_step()
-                if not step:
-                    break
-                action, pos, path, turns = step
-                if action == 'visit' or action == 'expand':
-                    continue
-                if action == 'goal':
-                    if path and len(path) >= 2:
-                        r1, c1 = path[0]
-                        r2, c2 = path[-1]
-                        self.remove_pair_and_check(r1, c1, r2, c2, path, auto=False)
-                        if not self.board.get_cells():
-                            break
-                elif action == 'none':
-                    break
-        finally:
-            self.algorithms.simulation_mode = was_sim
-            try:
-                self.algorithms.reset_simulation()
-            except Exception:
-                pass
-            self.clear_simulation_highlights()
-            self.clear_highlights()
-            try:
-                self.set_skip_enabled(False)
-            except Exception:
-                pass
+            self.set_skip_enabled(False)
+        except Exception:
+            pass
+
+        algo = self.ui.algo_var.get()
+        removed = cost = visited = generated = 0
+        reshuffles_in_row = 0
+        while self.board.get_cells() and reshuffles_in_row < SKIP_MAX_RESHUFFLES:
+            pair = self.planned_pair(algo) or self.find_pair(algo)
+            if not pair:
+                self.board.reshuffle_remaining(RESHUFFLE_GUARANTEED_MOVES)
+                self.reshuffle_count += 1
+                reshuffles_in_row += 1
+                continue
+            reshuffles_in_row = 0
+            (r1, c1), (r2, c2), path = pair
+            self.board.remove_pair(r1, c1, r2, c2)
+            stats = getattr(self, 'current_algorithm_stats', None) or self.algorithms.stats
+            visited += stats.get('visited', 0)
+            generated += stats.get('generated', 0)
+            cost += len(path) - 1 if path and len(path) > 1 else 1
+            removed += 2
+
+        self.algorithms.board = self.board.board
+        self.redraw_remaining_icons()
+        self.total_visited += visited
+        self.total_generated += generated
+        if removed:
+            self.play_sound("eat")
+            self.update_cost(cost)
+            self.background_revealed += removed
+            self.update_background_overlay()
+        if not self.board.get_cells():
+            self.win_game()
+        elif self.auto_running:
+            # vẫn bí sau nhiều lần reshuffle liên tiếp: trả lại cho auto play
+            self.auto_timer = self.root.after(400, self.continue_auto_play)
 
     def show_no_path_message(self):
         """Hiển thị thông báo không tìm thấy đường đi"""
@@ -682,36 +819,23 @@ class PikachuGame:
         if not self.auto_running or self.game_won:
             return
         algo = self.ui.algo_var.get()
-        pair = self.find_pair(algo)
+        self.current_trace = None
+        pair = self.planned_pair(algo, trace=True) or self.find_pair(algo, trace=True)
         if pair:
             (r1, c1), (r2, c2), path = pair
-            self.algorithms.start_simulation((r1, c1), (r2, c2), algo)
+            self.play_search((r1, c1), (r2, c2), algo, self.current_trace)
             self.simulate_auto_step()
         else:
             remaining_cells = self.board.get_cells()
             print(f"Remaining cells after pair search: {remaining_cells}")
             if remaining_cells:
-                self.board.reshuffle_remaining()
+                self.board.reshuffle_remaining(RESHUFFLE_GUARANTEED_MOVES)
                 # Track reshuffle count for history
                 self.reshuffle_count += 1
                 self.redraw_remaining_icons()
                 self.algorithms.board = self.board.board
-                # Tính lại visited và generated sau reshuffle (nếu cần)
-                temp_simulation_mode = self.algorithms.simulation_mode
-                self.algorithms.simulation_mode = True
-                pair = self.find_pair(algo)
-                if pair:
-                    (r1, c1), (r2, c2), path = pair
-                    self.algorithms.start_simulation((r1, c1), (r2, c2), algo)
-                    while True:
-                        step = self.algorithms.simulate_step()
-                        if not step or step[0] == "goal":
-                            break
-                    self.total_visited += self.algorithms.stats.get('visited', 0)
-                    self.total_generated += self.algorithms.stats.get('generated', 0)
-                self.algorithms.simulation_mode = temp_simulation_mode
                 self.algorithms.reset_simulation()
-                self.root.after(1000, self.continue_auto_play)
+                self.auto_timer = self.root.after(1000, self.continue_auto_play)
             else:
                 self.win_game()
 
@@ -721,11 +845,11 @@ class PikachuGame:
 
 
         algo = self.ui.algo_var.get()
-        pair = self.find_pair(algo)
+        pair = self.planned_pair(algo) or self.find_pair(algo)
         if not pair:
             # Không còn cặp hợp lệ, nếu còn ô -> reshuffle, nếu không -> win
             if self.board.get_cells():
-                self.board.reshuffle_remaining()
+                self.board.reshuffle_remaining(RESHUFFLE_GUARANTEED_MOVES)
                 # Track reshuffle count for history
                 self.reshuffle_count += 1
                 # vẽ lại toàn bộ các icon còn lại sau reshuffle
@@ -739,7 +863,7 @@ class PikachuGame:
                         icon = self.icons[self.board.board[r][c]]
                         self.ui.canvas.itemconfig(img_id, image=icon)
                 self.algorithms.board = self.board.board
-                self.root.after(300, self.auto_play)
+                self.auto_timer = self.root.after(300, self.auto_play)
                 return
             else:
                 self.win_game()
@@ -747,7 +871,7 @@ class PikachuGame:
         (r1, c1), (r2, c2), path = pair
         self.play_sound("select")
         self.draw_lightning(path)
-        self.root.after(350, lambda: self.remove_pair_and_check(r1, c1, r2, c2, path, auto=True))
+        self.auto_timer = self.root.after(350, lambda: self.remove_pair_and_check(r1, c1, r2, c2, path, auto=True))
 
     def remove_pair_and_check(self, r1, c1, r2, c2, path=None, auto=False):
         if self.game_won:
@@ -769,22 +893,9 @@ class PikachuGame:
         self.background_revealed += 2
         self.update_background_overlay()
 
-        # Cập nhật tổng visited và generated
-        if auto:
-            # Lấy từ simulate_auto_step
-            current_stats = getattr(self.algorithms, 'stats', {'visited': 0, 'generated': 0})
-        else:
-            # Tính lại cho chế độ thủ công bằng cách chạy mô phỏng tạm thời
-            temp_simulation_mode = self.algorithms.simulation_mode
-            self.algorithms.simulation_mode = True
-            self.algorithms.start_simulation((r1, c1), (r2, c2), self.ui.algo_var.get())
-            while True:
-                step = self.algorithms.simulate_step()
-                if not step or step[0] == "goal":
-                    break
-            current_stats = self.algorithms.stats.copy()
-            self.algorithms.simulation_mode = temp_simulation_mode
-            self.algorithms.reset_simulation()
+        # Cập nhật tổng visited và generated: thống kê của chính lần search đã tìm ra cặp này
+        # (click thủ công, find_pair / planned_pair của auto play), không phải của lần phát lại trace
+        current_stats = getattr(self, 'current_algorithm_stats', {'visited': 0, 'generated': 0})
 
         self.total_visited += current_stats.get('visited', 0)
         self.total_generated += current_stats.get('generated', 0)
@@ -792,7 +903,7 @@ class PikachuGame:
         if not self.board.get_cells() and not self.game_won:
             self.win_game()
         elif auto and not self.game_won:
-            self.root.after(400, self.continue_auto_play)
+            self.auto_timer = self.root.after(400, self.continue_auto_play)
         else:
             # For manual mode, if timer not running start it when the first successful pair is removed
             if not auto and not self.timer_running:
@@ -1010,7 +1121,7 @@ class PikachuGame:
 
         self.filter_algo_var = tk.StringVar(value="All")
         algo_filter = ttk.Combobox(toolbar_frame, textvariable=self.filter_algo_var,
-                                   values=["All", "DFS", "BFS", "UCS", "A*", "Manual"],
+                                   values=["All", "DFS", "BFS", "UCS", "A*", "Ray", "0-1 BFS", "Batch", "Bi-BFS", "Segments", "Manual"],
                                    state="readonly", width=10)
         algo_filter.pack(side="left", padx=(0, 20))
 
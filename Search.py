@@ -1,8 +1,20 @@
+from array import array
 from collections import deque
-import heapq
 import time
 
+from Board import BORDER, EMPTY
+
+# NumPy là phụ thuộc tùy chọn (pip install numpy), chỉ engine "Batch" dùng tới
+try:
+    import numpy as np
+except ImportError:  # engine "Batch" sẽ quay về ray_connect từng cặp
+    np = None
+
+BATCH_CHUNK = 2048  # số cặp xử lý trong một lượt vector hóa (giới hạn bộ nhớ mảng tạm)
+
 class SearchAlgorithms:
+    DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+
     def __init__(self, board, rows, cols):
         self.board = board
         self.rows = rows
@@ -14,12 +26,42 @@ class SearchAlgorithms:
             'time_ms': 0
         }
         self.simulation_mode = False
-        self.simulation_steps = []
+        self.simulation_trace = None  # generator sinh từng sự kiện simulation khi được hỏi tới
+        self.simulation_time = 0.0    # thời gian tìm kiếm thực (không tính lúc chờ vẽ giữa các bước)
         self.current_step = 0
+        self.simulation_steps = None  # SimulationTrace khi cần giữ lại toàn bộ trace
+        self._trace_path = None  # dựng path cho sự kiện simulation từ chỉ số parent
+        self._trace_links = None  # (mảng parent, số trạng thái mỗi ô) cho SimulationTrace
+        self.turn_pruning = True  # A* cắt các trạng thái chắc chắn cần quá max_turns lần rẽ
+        # giới hạn đường đi đưa thẳng vào dfs/bfs/ucs/astar: trạng thái vượt giới hạn không được mở rộng
+        self.max_len = None   # số ô tối đa của đường đi (tính cả hai đầu), None = không giới hạn
+        self.max_turns = 2
         self.debug = False
 
+    @property
+    def board(self):
+        return self._board
+
+    @board.setter
+    def board(self, board):
+        """Nhận BoardView của Board: tìm đường đọc thẳng mảng phẳng có viền canh."""
+        self._board = board
+        self.owner = board.owner
+        self.grid = board.grid
+        self.width = board.width
+        self.offsets = board.offsets
+        self._search_workspace = None  # cấp phát lại theo kích thước bảng mới khi cần
+        self._segment_graph = None     # SegmentGraph của bảng cũ không dùng lại được
+
+    def _index(self, pos):
+        return (pos[0] + 1) * self.width + pos[1] + 1
+
+    def _pos(self, i):
+        r, c = divmod(i, self.width)
+        return r - 1, c - 1
+
     def neighbors(self, r, c):
-        for dr, dc in [(1, 0), (-1, 0), (0, 1), (0, -1)]:
+        for dr, dc in self.DIRECTIONS:
             nr, nc = r + dr, c + dc
             if 0 <= nr < self.rows and 0 <= nc < self.cols:
                 yield nr, nc, dr, dc
@@ -35,25 +77,160 @@ class SearchAlgorithms:
                 turns += 1
         return turns
 
-    def start_simulation(self, start, goal, algo):
-        """Bắt đầu chế độ simulation với thuật toán được chọn"""
+    def set_limits(self, max_len=None, max_turns=2):
+        """Đặt giới hạn độ dài / số lần rẽ cho các lần tìm sau (vd. theo chế độ chơi).
+
+        Số lần rẽ không vượt quá 2: đó là luật nối của trò chơi và là số lớp rẽ mà mã hóa
+        trạng thái (ô * 4 + hướng) * 3 + số lần rẽ dành chỗ.
+        """
+        self.max_len = max_len
+        self.max_turns = min(max_turns, 2)
+
+    def _length_bound(self, target):
+        """Hàm fits(i, steps): True nếu đã đi steps bước tới ô i mà vẫn còn có thể tới target trong
+        max_len (khoảng cách Manhattan còn lại là cận dưới số bước); None khi không giới hạn độ dài."""
+        if self.max_len is None:
+            return None
+        width, limit = self.width, self.max_len - 1
+        goal_r, goal_c = divmod(target, width)
+
+        def fits(i, steps):
+            r, c = divmod(i, width)
+            return steps + abs(r - goal_r) + abs(c - goal_c) <= limit
+        return fits
+
+    def _turn_bound(self, target):
+        """Hàm need(i, d): cận dưới số lần rẽ còn phải thực hiện để từ ô i (đang đi theo hướng d,
+        d = -1 ở ô xuất phát) tới được target bằng một đường đi không quay đầu.
+
+        0 nếu đã thẳng hàng và đang hướng về target, 1 nếu thẳng hàng nhưng đi vuông góc hoặc
+        chưa thẳng hàng nhưng đang đi về phía target, 2 nếu chưa thẳng hàng và đang đi xa ra,
+        3 nếu thẳng hàng mà đi ngược chiều (phải ra khỏi hàng/cột rồi quay lại).
+        """
+        if not self.turn_pruning:
+            return lambda i, d: 0
+        width = self.width
+        goal_r, goal_c = divmod(target, width)
+        directions = self.DIRECTIONS
+
+        def need(i, d):
+            if i == target:
+                return 0
+            r, c = divmod(i, width)
+            vr = (goal_r > r) - (goal_r < r)
+            vc = (goal_c > c) - (goal_c < c)
+            if d < 0:
+                return 0 if vr == 0 or vc == 0 else 1
+            dr, dc = directions[d]
+            if vr == 0 or vc == 0:
+                if dr == vr and dc == vc:
+                    return 0
+                return 3 if dr == -vr and dc == -vc else 1
+            return 1 if dr == vr or dc == vc else 2
+        return need
+
+    def start_simulation(self, start, goal, algo, keep_trace=False):
+        """Bắt đầu chế độ simulation với thuật toán được chọn.
+
+        Các _simulate_* là generator: tìm kiếm chỉ chạy tới sự kiện tiếp theo mỗi lần
+        simulate_step được gọi, nên không có danh sách sự kiện nào được giữ lại.
+        Với keep_trace=True các sự kiện đã sinh được ghi gọn vào simulation_steps
+        (SimulationTrace) để xem lại bằng rewind_simulation.
+        """
         self.simulation_mode = True
-        self.simulation_steps.clear()
+        self.simulation_trace = self._simulation_events(start, goal, algo)
+        self.simulation_steps = SimulationTrace(self, start) if keep_trace else None
+        self.simulation_time = 0.0
         self.current_step = 0
 
+    def _simulation_events(self, start, goal, algo):
+        """Generator sự kiện simulation của thuật toán algo (None nếu không hỗ trợ)."""
         if algo == "DFS":
-            self._simulate_dfs(start, goal)
+            return self._simulate_dfs(start, goal)
         elif algo == "BFS":
-            self._simulate_bfs(start, goal)
+            return self._simulate_bfs(start, goal)
         elif algo == "UCS":
-            self._simulate_ucs(start, goal)
+            return self._simulate_ucs(start, goal)
         elif algo == "A*":
-            self._simulate_astar(start, goal)
+            return self._simulate_astar(start, goal)
         elif algo == "HillClimb":
-            self._simulate_hill_climb(start, goal)
+            return self._simulate_hill_climb(start, goal)
+        elif algo in ("Ray", "Batch"):
+            # Batch cho đúng đường của Ray, nên dùng chung trace bắn tia
+            return self._simulate_ray(start, goal)
+        elif algo == "0-1 BFS":
+            return self._simulate_bfs01(start, goal)
+        elif algo == "Bi-BFS":
+            return self._simulate_bibfs(start, goal)
+        elif algo == "Segments":
+            return self._simulate_segments(start, goal)
+        return None
 
-    def _simulate_dfs(self, start, goal):
+    def search(self, start, goal, algo, trace=False):
+        """Chạy thuật toán algo đúng một lần cho cặp (start, goal).
+
+        Trả về (path, stats, trace): path là đường đi hoặc None, stats là thống kê của chính
+        lần chạy này. Khi trace=True và tìm được đường, trace là SimulationTrace của lần chạy
+        để phát lại bằng play_trace thay vì chạy lại tìm kiếm trong start_simulation; các sự
+        kiện chỉ được nén vào trace khi có đường, nên quét nhiều cặp không nối được vẫn rẻ.
+        """
         start_time = time.time()
+        self.stats = {'steps': 0, 'visited': 0, 'generated': 0, 'time_ms': 0}
+        events = self._simulation_events(start, goal, algo)
+        events = list(events) if events is not None else []
+        path = events[-1][2] if events and events[-1][0] == "goal" else None
+        self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
+        stats = self.stats.copy()
+        recorded = None
+        if trace and path:
+            recorded = SimulationTrace(self, start)
+            for event in events:
+                recorded.append(*event)
+            recorded.stats = stats
+        return path, stats, recorded
+
+    def play_trace(self, trace):
+        """Phát lại trace do search(..., trace=True) ghi, qua simulate_step như start_simulation."""
+        self.simulation_mode = True
+        self.simulation_trace = None
+        self.simulation_steps = trace
+        self.current_step = 0
+        self.stats = trace.stats.copy()
+
+    def _reset_stats(self):
+        """Đặt lại self.stats tại chỗ thay vì tạo dict mới cho mỗi lần tìm (bên gọi luôn copy)."""
+        stats = self.stats
+        stats['steps'] = stats['visited'] = stats['generated'] = stats['time_ms'] = 0
+        return stats
+
+    def _workspace(self):
+        """SearchWorkspace của bảng hiện tại, đã sang epoch mới cho một lần tìm."""
+        ws = self._search_workspace
+        if ws is None or len(ws.parent) != len(self.grid):
+            ws = self._search_workspace = SearchWorkspace(len(self.grid))
+        ws.begin()
+        return ws
+
+    def _cell_path(self, parent, cell):
+        """Dựng lại đường đi từ mảng parent (chỉ số ô), đi ngược từ cell về start."""
+        path = []
+        while cell >= 0:
+            path.append(self._pos(cell))
+            cell = parent[cell]
+        path.reverse()
+        return path
+
+    def _cell_trace(self, parent):
+        """Hàm dựng đường đi cho các sự kiện simulation lưu chỉ số ô thay vì bản sao path."""
+        self._trace_links = (parent, 1)
+        def rebuild(link, pos):
+            path = self._cell_path(parent, link)
+            if path[-1] != pos:
+                path.append(pos)
+            return path
+        return rebuild
+
+    def _simulate_dfs(self, start, goal):
         if 'steps' not in self.stats:
             self.stats = {'steps': 0, 'visited': 0, 'generated': 0, 'time_ms': 0}
         else:
@@ -65,58 +242,62 @@ class SearchAlgorithms:
         rejected_turns = 0  #số ô lân cận bị từ chối do vượt turns
         rejected_blocked = 0    #số ô lân cận bị từ chối do không là ô trống hoặc goal
 
-        stack = [(start, [start], 0)]   #bắt đầu ở ô start, đường đi ban đầu [start], số lần rẽ = 0
+        grid, offsets = self.grid, self.offsets
+        source, target = self._index(start), self._index(goal)
+        max_turns, fits = self.max_turns, self._length_bound(target)
+        parent = array('i', [-1]) * len(grid)  # parent[ô] = ô đứng trước trên đường đi
+        depth = array('i', [0]) * len(grid)    # số bước từ start tới ô (khi có giới hạn độ dài)
+        self._trace_path = self._cell_trace(parent)
+        stack = [(source, -1, -1, 0)]   #(ô, ô cha, hướng đi vào ô, số lần rẽ)
         visited = set()
-        generated = set([start])
+        generated = set([source])
         self.stats['generated'] = 1 if self.stats['generated'] == 0 else self.stats['generated']
 
         while stack:
-            (r, c), path, turns = stack.pop()
+            i, prev, d, turns = stack.pop()
 
-            if (r, c) in visited:
+            if i in visited:
                 continue
             # mark as visited (expanded)
-            visited.add((r, c))
+            visited.add(i)
+            parent[i] = prev
+            depth[i] = depth[prev] + 1 if prev >= 0 else 0
             self.stats['visited'] = 1
 
-            if self.simulation_mode:
-                self.simulation_steps.append(("visit", (r, c), path.copy(), turns))
+            yield "visit", self._pos(i), i, turns
 
-            if (r, c) == goal and self.count_turns(path) <= 2:
+            if i == target and turns <= max_turns:
+                path = self._cell_path(parent, i)
                 self.stats['steps'] = len(path) - 1
                 self.stats['visited'] = len(visited)
                 self.stats['generated'] = len(generated)
-                self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
-                self.simulation_steps.append(("goal", (r, c), path.copy(), turns))
+                yield "goal", goal, path, turns
                 return
 
-            for nr, nc, dr, dc in self.neighbors(r, c):
+            for nd, offset in enumerate(offsets):
+                n = i + offset
                 total_candidates += 1
-                if not (self.board[nr][nc] == -1 or (nr, nc) == goal):
+                if not (grid[n] == EMPTY or n == target):
                     rejected_blocked += 1
                     continue
-                new_path = path + [(nr, nc)]
-                new_turns = self.count_turns(new_path)
-                if new_turns <= 2:
+                new_turns = turns if d < 0 or d == nd else turns + 1
+                if new_turns <= max_turns and (fits is None or fits(n, depth[i] + 1)):
                     accepted += 1
-                    stack.append(((nr, nc), new_path, new_turns))
+                    stack.append((n, i, nd, new_turns))
                     # count generated when neighbor is created (pushed to frontier)
-                    if (nr, nc) not in generated:
-                        generated.add((nr, nc))
+                    if n not in generated:
+                        generated.add(n)
                         self.stats['generated'] = len(generated)
-                    if self.simulation_mode:
-                        self.simulation_steps.append(("expand", (nr, nc), new_path.copy(), new_turns))
+                    yield "expand", self._pos(n), i, new_turns
                 else:
                     rejected_turns += 1
 
-        self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
         if self.debug:
             print(
                 f"_simulate_dfs: candidates={total_candidates}, accepted={accepted}, rejected_turns={rejected_turns}, rejected_blocked={rejected_blocked}, generated={self.stats['generated']}, visited={self.stats['visited']}")
-        self.simulation_steps.append(("none", None, None, None))
+        yield "none", None, None, None
 
     def _simulate_bfs(self, start, goal):
-        start_time = time.time()
         if 'steps' not in self.stats:
             self.stats = {'steps': 0, 'visited': 0, 'generated': 0, 'time_ms': 0}
         else:
@@ -128,53 +309,57 @@ class SearchAlgorithms:
         rejected_turns = 0
         rejected_blocked = 0
 
-        queue = deque([(start, [start], 0)])
+        grid, offsets = self.grid, self.offsets
+        source, target = self._index(start), self._index(goal)
+        max_turns, fits = self.max_turns, self._length_bound(target)
+        parent = array('i', [-1]) * len(grid)
+        depth = array('i', [0]) * len(grid)
+        self._trace_path = self._cell_trace(parent)
+        queue = deque([(source, -1, -1, 0)])
         visited = set()
-        generated = set([start])
+        generated = set([source])
         self.stats['generated'] = 1 if self.stats['generated'] == 0 else self.stats['generated']
 
         while queue:
-            (r, c), path, turns = queue.popleft()
+            i, prev, d, turns = queue.popleft()
 
-            if (r, c) in visited:
+            if i in visited:
                 continue
-            visited.add((r, c))
+            visited.add(i)
+            parent[i] = prev
+            depth[i] = depth[prev] + 1 if prev >= 0 else 0
             self.stats['visited'] += 1
 
-            if self.simulation_mode:
-                self.simulation_steps.append(("visit", (r, c), path.copy(), turns))
+            yield "visit", self._pos(i), i, turns
 
-            if (r, c) == goal and self.count_turns(path) <= 2:
+            if i == target and turns <= max_turns:
+                path = self._cell_path(parent, i)
                 self.stats['steps'] = len(path) - 1
-                self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
-                self.simulation_steps.append(("goal", (r, c), path.copy(), turns))
+                yield "goal", goal, path, turns
                 return
 
-            for nr, nc, dr, dc in self.neighbors(r, c):
+            for nd, offset in enumerate(offsets):
+                n = i + offset
                 total_candidates += 1
-                if not (self.board[nr][nc] == -1 or (nr, nc) == goal):
+                if not (grid[n] == EMPTY or n == target):
                     rejected_blocked += 1
                     continue
-                new_path = path + [(nr, nc)]
-                new_turns = self.count_turns(new_path)
-                if new_turns <= 2:
+                new_turns = turns if d < 0 or d == nd else turns + 1
+                if new_turns <= max_turns and (fits is None or fits(n, depth[i] + 1)):
                     accepted += 1
-                    queue.append(((nr, nc), new_path, new_turns))
-                    if (nr, nc) not in generated:
-                        generated.add((nr, nc))
+                    queue.append((n, i, nd, new_turns))
+                    if n not in generated:
+                        generated.add(n)
                         self.stats['generated'] += 1
-                    if self.simulation_mode:
-                        self.simulation_steps.append(("expand", (nr, nc), new_path.copy(), new_turns))
+                    yield "expand", self._pos(n), i, new_turns
                 else:
                     rejected_turns += 1
 
-        self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
         if self.debug:
             print(f"_simulate_bfs: candidates={total_candidates}, accepted={accepted}, rejected_turns={rejected_turns}, rejected_blocked={rejected_blocked}, generated={self.stats['generated']}, visited={self.stats['visited']}")
-        self.simulation_steps.append(("none", None, None, None))
+        yield "none", None, None, None
 
     def _simulate_ucs(self, start, goal):
-        start_time = time.time()
         # Không reset hoàn toàn stats, chỉ khởi tạo nếu chưa tồn tại hoặc reset một phần
         if 'steps' not in self.stats:
             self.stats = {'steps': 0, 'visited': 0, 'generated': 0, 'time_ms': 0}
@@ -187,53 +372,62 @@ class SearchAlgorithms:
         rejected_turns = 0
         rejected_blocked = 0
 
-        pq = [(0, start, [start], 0)]
+        grid, offsets = self.grid, self.offsets
+        source, target = self._index(start), self._index(goal)
+        parent = array('i', [-1]) * len(grid)
+        self._trace_path = self._cell_trace(parent)
+        # frontier chỉ giữ trạng thái (ô * 4 + hướng) * 3 + số lần rẽ, khóa là cost * 3 + số lần rẽ
+        # (cùng cost thì trạng thái ít rẽ hơn được lấy ra và đánh dấu ô trước); ô cha suy ra từ
+        # hướng đi vào ô, trạng thái của source mang hướng -1
+        max_turns, fits = self.max_turns, self._length_bound(target)
+        pq = BucketQueue()
+        pq.push(0, source * 12)
         visited = set()
-        generated = set([start])
+        generated = set([source])
         self.stats['generated'] = 1 if self.stats['generated'] == 0 else self.stats['generated']
 
         while pq:
-            cost, (r, c), path, turns = heapq.heappop(pq)
+            key, s = pq.pop()
+            cost, i, turns = key // 3, s // 12, s % 3
+            d = -1 if i == source else s // 3 % 4
+            prev = i - offsets[d] if d >= 0 else -1
 
-            if (r, c) in visited:
+            if i in visited:
                 continue
-            visited.add((r, c))
+            visited.add(i)
+            parent[i] = prev
             self.stats['visited'] += 1  # Tăng dần thay vì gán lại
 
-            if self.simulation_mode:
-                self.simulation_steps.append(("visit", (r, c), path.copy(), turns))
+            yield "visit", self._pos(i), i, turns
 
-            if (r, c) == goal and self.count_turns(path) <= 2:
+            if i == target and turns <= max_turns:
+                path = self._cell_path(parent, i)
                 self.stats['steps'] = len(path) - 1
-                self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
-                self.simulation_steps.append(("goal", (r, c), path.copy(), turns))
+                yield "goal", goal, path, turns
                 return
 
-            for nr, nc, dr, dc in self.neighbors(r, c):
+            for nd, offset in enumerate(offsets):
+                n = i + offset
                 total_candidates += 1
-                if not (self.board[nr][nc] == -1 or (nr, nc) == goal):
+                if not (grid[n] == EMPTY or n == target):
                     rejected_blocked += 1
                     continue
-                new_path = path + [(nr, nc)]
-                new_turns = self.count_turns(new_path)
-                if new_turns <= 2:
+                new_turns = turns if d < 0 or d == nd else turns + 1
+                if new_turns <= max_turns and (fits is None or fits(n, cost + 1)):
                     accepted += 1
-                    heapq.heappush(pq, (cost + 1, (nr, nc), new_path, new_turns))
-                    if (nr, nc) not in generated:
-                        generated.add((nr, nc))
+                    pq.push(3 * (cost + 1) + new_turns, (n * 4 + nd) * 3 + new_turns)
+                    if n not in generated:
+                        generated.add(n)
                         self.stats['generated'] += 1
-                    if self.simulation_mode:
-                        self.simulation_steps.append(("expand", (nr, nc), new_path.copy(), new_turns))
+                    yield "expand", self._pos(n), i, new_turns
                 else:
                     rejected_turns += 1
 
-        self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
         if self.debug:
             print(f"_simulate_ucs: candidates={total_candidates}, accepted={accepted}, rejected_turns={rejected_turns}, rejected_blocked={rejected_blocked}, generated={self.stats['generated']}, visited={self.stats['visited']}")
-        self.simulation_steps.append(("none", None, None, None))
+        yield "none", None, None, None
 
     def _simulate_astar(self, start, goal):
-        start_time = time.time()
         # Không reset hoàn toàn stats, chỉ khởi tạo nếu chưa tồn tại hoặc reset một phần
         if 'steps' not in self.stats:
             self.stats = {'steps': 0, 'visited': 0, 'generated': 0, 'time_ms': 0}
@@ -241,63 +435,77 @@ class SearchAlgorithms:
             self.stats['steps'] = 0  # Reset steps cho nước đi mới
             self.stats['time_ms'] = 0  # Reset time cho nước đi mới
 
-        def h(a, b):
-            return abs(a[0] - b[0]) + abs(a[1] - b[1])
+        width = self.width
+        goal_r, goal_c = divmod(self._index(goal), width)
+
+        def h(i):
+            r, c = divmod(i, width)
+            return abs(r - goal_r) + abs(c - goal_c)
 
         total_candidates = 0
         accepted = 0
         rejected_turns = 0
         rejected_blocked = 0
 
-        pq = [(h(start, goal), 0, start, [start], 0)]
+        grid, offsets = self.grid, self.offsets
+        source, target = self._index(start), self._index(goal)
+        need = self._turn_bound(target)
+        max_turns = self.max_turns
+        limit = len(grid) if self.max_len is None else self.max_len - 1  # số bước tối đa
+        parent = array('i', [-1]) * len(grid)
+        self._trace_path = self._cell_trace(parent)
+        # như UCS nhưng khóa là f * 3 + số lần rẽ, f = g + h; h nhất quán nên khóa không bao giờ giảm
+        pq = BucketQueue(3 * h(source))
+        pq.push(3 * h(source), source * 12)
         visited = set()
-        generated = set([start])
+        generated = set([source])
         self.stats['generated'] = 1 if self.stats['generated'] == 0 else self.stats['generated']
 
         while pq:
-            f, g, (r, c), path, turns = heapq.heappop(pq)
+            key, s = pq.pop()
+            f, i, turns = key // 3, s // 12, s % 3
+            d = -1 if i == source else s // 3 % 4
+            prev = i - offsets[d] if d >= 0 else -1
+            g = f - h(i)
 
-            if (r, c) in visited:
+            if i in visited:
                 continue
-            visited.add((r, c))
+            visited.add(i)
+            parent[i] = prev
             self.stats['visited'] += 1  # Tăng dần thay vì gán lại
 
-            if self.simulation_mode:
-                self.simulation_steps.append(("visit", (r, c), path.copy(), turns))
+            yield "visit", self._pos(i), i, turns
 
-            if (r, c) == goal and self.count_turns(path) <= 2:
+            if i == target and turns <= max_turns:
+                path = self._cell_path(parent, i)
                 self.stats['steps'] = len(path) - 1
-                self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
-                self.simulation_steps.append(("goal", (r, c), path.copy(), turns))
+                yield "goal", goal, path, turns
                 return
 
-            for nr, nc, dr, dc in self.neighbors(r, c):
+            for nd, offset in enumerate(offsets):
+                n = i + offset
                 total_candidates += 1
-                if not (self.board[nr][nc] == -1 or (nr, nc) == goal):
+                if not (grid[n] == EMPTY or n == target):
                     rejected_blocked += 1
                     continue
-                new_path = path + [(nr, nc)]
-                new_turns = self.count_turns(new_path)
-                if new_turns <= 2:
+                new_turns = turns if d < 0 or d == nd else turns + 1
+                new_g = g + 1
+                if new_turns + need(n, nd) <= max_turns and new_g + h(n) <= limit:
                     accepted += 1
-                    new_g = g + 1
-                    heapq.heappush(pq, (new_g + h((nr, nc), goal), new_g, (nr, nc), new_path, new_turns))
-                    if (nr, nc) not in generated:
-                        generated.add((nr, nc))
+                    pq.push(3 * (new_g + h(n)) + new_turns, (n * 4 + nd) * 3 + new_turns)
+                    if n not in generated:
+                        generated.add(n)
                         self.stats['generated'] += 1
-                    if self.simulation_mode:
-                        self.simulation_steps.append(("expand", (nr, nc), new_path.copy(), new_turns))
+                    yield "expand", self._pos(n), i, new_turns
                 else:
                     rejected_turns += 1
 
-        self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
         if self.debug:
             print(f"_simulate_astar: candidates={total_candidates}, accepted={accepted}, rejected_turns={rejected_turns}, rejected_blocked={rejected_blocked}, generated={self.stats['generated']}, visited={self.stats['visited']}")
-        self.simulation_steps.append(("none", None, None, None))
+        yield "none", None, None, None
 
     def _simulate_hill_climb(self, start, goal):
         """Simple hill-climbing / greedy best-first style simulation toward the goal."""
-        start_time = time.time()
         # Không reset hoàn toàn stats, chỉ khởi tạo nếu chưa tồn tại hoặc reset một phần
         if 'steps' not in self.stats:
             self.stats = {'steps': 0, 'visited': 0, 'generated': 0, 'time_ms': 0}
@@ -305,280 +513,466 @@ class SearchAlgorithms:
             self.stats['steps'] = 0  # Reset steps cho nước đi mới
             self.stats['time_ms'] = 0  # Reset time cho nước đi mới
 
-        def h(a, b):
-            return abs(a[0] - b[0]) + abs(a[1] - b[1])
+        grid, offsets, width = self.grid, self.offsets, self.width
+        target = self._index(goal)
+        goal_r, goal_c = divmod(target, width)
+
+        def h(i):
+            r, c = divmod(i, width)
+            return abs(r - goal_r) + abs(c - goal_c)
 
-        current = start
-        path = [start]
+        parent = array('i', [-1]) * len(grid)
+        self._trace_path = self._cell_trace(parent)
+        current = self._index(start)
+        d, turns = -1, 0
         visited = set([current])
-        generated = set([start])
+        generated = set([current])
         self.stats['generated'] = 1 if self.stats['generated'] == 0 else self.stats['generated']
 
         # add initial visit
-        if self.simulation_mode:
-            self.simulation_steps.append(("visit", current, path.copy(), self.count_turns(path)))
+        yield "visit", start, current, turns
 
         while True:
-            if current == goal and self.count_turns(path) <= 2:
+            if current == target and turns <= self.max_turns:
+                path = self._cell_path(parent, current)
                 self.stats['steps'] = len(path) - 1
-                self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
-                self.simulation_steps.append(("goal", current, path.copy(), self.count_turns(path)))
+                yield "goal", goal, path, turns
                 return
 
             # generate neighbors and pick the neighbor with lowest h (greedy)
             neighbors = []
-            for nr, nc, dr, dc in self.neighbors(current[0], current[1]):
-                if self.board[nr][nc] == -1 or (nr, nc) == goal:
-                    if (nr, nc) not in visited:
-                        new_path = path + [(nr, nc)]
-                        new_turns = self.count_turns(new_path)
-                        if new_turns <= 2:
-                            neighbors.append(((nr, nc), new_path, new_turns))
+            for nd, offset in enumerate(offsets):
+                n = current + offset
+                if grid[n] == EMPTY or n == target:
+                    if n not in visited:
+                        new_turns = turns if d < 0 or d == nd else turns + 1
+                        if new_turns <= self.max_turns:
+                            neighbors.append((n, nd, new_turns))
                         # count generated even if filtered by turns
-                            generated.add((nr, nc))
+                            generated.add(n)
                         self.stats['generated'] += 1
 
-            if self.simulation_mode:
-                for nb, nb_path, nb_turns in neighbors:
-                    self.simulation_steps.append(("expand", nb, nb_path.copy(), nb_turns))
+            for nb, nb_d, nb_turns in neighbors:
+                yield "expand", self._pos(nb), current, nb_turns
 
             if not neighbors:
                 self.stats['visited'] = len(visited)
-                self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
-                self.simulation_steps.append(("none", None, None, None))
+                yield "none", None, None, None
                 return
 
             # choose best neighbor by heuristic
-            neighbors.sort(key=lambda x: h(x[0], goal))
-            best, best_path, best_turns = neighbors[0]
+            neighbors.sort(key=lambda x: h(x[0]))
+            best, best_d, best_turns = neighbors[0]
 
             # if no improvement in heuristic, we're stuck (hill climbing)
-            if h(best, goal) >= h(current, goal):
+            if h(best) >= h(current):
                 self.stats['visited'] = len(visited)
-                self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
-                self.simulation_steps.append(("none", None, None, None))
+                yield "none", None, None, None
                 return
 
             # move to best
-            current = best
-            path = best_path
+            parent[best] = current
+            current, d, turns = best, best_d, best_turns
             visited.add(current)
             self.stats['visited'] += 1
-            if self.simulation_mode:
-                self.simulation_steps.append(("visit", current, path.copy(), best_turns))
+            yield "visit", self._pos(current), current, turns
+
+    def _simulate_bfs01(self, start, goal):
+        """Simulation cho 0-1 BFS trên không gian trạng thái (ô, hướng, số lần rẽ)."""
+        path = yield from self._bfs01_steps(start, goal, trace=True)
+        if path is None:
+            yield "none", None, None, None
+
+    def _simulate_bibfs(self, start, goal):
+        """Simulation cho tìm kiếm hai chiều: sự kiện của cả hai phía theo thứ tự mở rộng."""
+        path = yield from self._bibfs_steps(start, goal, trace=True)
+        if path is None:
+            yield "none", None, None, None
+
+    def _simulate_segments(self, start, goal):
+        """Simulation cho engine đồ thị đoạn: thăm các ô của từng dải trống được xét rồi trả về goal."""
+        corners = self.segment_graph.connect(start, goal)
+        for run in self.segment_graph.visited_runs:
+            for cell in self.segment_graph.run_cells(run):
+                yield "visit", self._pos(cell), None, None
+        if corners:
+            yield "goal", goal, self.corners_to_path(corners), len(corners) - 2
+            return
+        yield "none", None, None, None
+
+    def _simulate_ray(self, start, goal):
+        """Simulation cho engine ray casting: thăm các ô trên tia của hai đầu rồi trả về goal."""
+        start_rays = self.cast_rays(start)
+        goal_rays = self.cast_rays(goal)
+        for rays in (start_rays, goal_rays):
+            for cells in rays.values():
+                for cell in cells:
+                    yield "visit", cell, None, None
+
+        corners = self.ray_connect(start, goal)
+        if corners:
+            path = self.corners_to_path(corners)
+            yield "goal", goal, path, len(corners) - 2
+            return
+        yield "none", None, None, None
 
     def simulate_step(self):
         """Trả về bước tiếp theo trong quá trình simulation"""
-        if self.current_step >= len(self.simulation_steps):
+        recorded = self.simulation_steps
+        if recorded is not None and self.current_step < len(recorded):
+            step = recorded[self.current_step]
+            self.current_step += 1
+            return step
+        if self.simulation_trace is None:
+            return None
+        start_time = time.time()
+        step = next(self.simulation_trace, None)
+        self.simulation_time += time.time() - start_time
+        if step is None:
+            self.simulation_trace = None
             return None
-        step = self.simulation_steps[self.current_step]
         self.current_step += 1
+        action, pos, link, turns = step
+        if action in ("goal", "none"):
+            self.stats['time_ms'] = round(self.simulation_time * 1000, 1)
+        if recorded is not None:
+            recorded.append(action, pos, link, turns)
+        if isinstance(link, int):
+            # sự kiện chỉ lưu chỉ số parent, đường đi được dựng lại khi cần hiển thị
+            return action, pos, self._trace_path(link, pos), turns
         return step
 
+    def rewind_simulation(self, step=0):
+        """Quay lại bước step của trace đã ghi (start_simulation với keep_trace=True)."""
+        if self.simulation_steps is not None:
+            self.current_step = max(0, min(step, len(self.simulation_steps)))
+
     def reset_simulation(self):
         """Đặt lại simulation để bắt đầu lại"""
         self.simulation_mode = False
-        self.simulation_steps.clear()
+        self.simulation_trace = None
+        self.simulation_steps = None
         self.current_step = 0
 
-    def find_pair(self, algo):
-        """Tìm một cặp ô có thể kết nối được"""
-        coords = []
-        for r in range(self.rows):
-            for c in range(self.cols):
-                if self.board[r][c] != -1:
-                    coords.append((r, c))
-
-        for i in range(len(coords)):
-            for j in range(i + 1, len(coords)):
-                r1, c1 = coords[i]
-                r2, c2 = coords[j]
-                if self.board[r1][c1] == self.board[r2][c2]:
-                    # Tạm thời tắt simulation mode để tìm đường đi nhanh
-                    temp_simulation_mode = self.simulation_mode
-                    self.simulation_mode = False
-
-                    path = None
-                    if algo == "DFS":
-                        path = self.dfs((r1, c1), (r2, c2))
-                    elif algo == "BFS":
-                        path = self.bfs((r1, c1), (r2, c2))
-                    elif algo == "UCS":
-                        path = self.ucs((r1, c1), (r2, c2))
-                    elif algo == "A*":
-                        path = self.astar((r1, c1), (r2, c2))
-
-                    # Khôi phục simulation mode
-                    self.simulation_mode = temp_simulation_mode
-
-                    if path and len(path) <= 6:  # Giới hạn độ dài đường đi
-                        return (r1, c1), (r2, c2), path
+    def find_pair(self, algo, max_len=6, trace=False):
+        """Tìm một cặp ô có thể kết nối được bằng đường đi tối đa max_len ô (None: không giới hạn).
+
+        Cặp trả về là cặp đầu tiên theo thứ tự candidate_pairs mà engine algo nối được trong
+        max_len ô. dfs/bfs/ucs/astar nhận max_len làm giới hạn ngay trong lúc tìm; các engine còn
+        lại lọc theo độ dài sau khi có đường đi. self.stats là thống kê của lần tìm ra cặp.
+
+        trace=True: trả về (start, goal, path, trace), với trace là SimulationTrace của chính lần
+        search tìm ra cặp (để phát lại thay vì tìm lại).
+        """
+        if trace:
+            return self._find_traced_pair(algo, max_len)
+        if algo == "0-1 BFS":
+            # Một lần quét cho mỗi ô nguồn thay vì một lần tìm cho mỗi cặp
+            for start in self.board.owner.get_cells():
+                matches = self.find_matches(start)
+                for goal in sorted(goal for goal in matches if goal > start):
+                    if max_len is None or len(matches[goal]) <= max_len:
+                        return start, goal, matches[goal]
+            return None
+        if algo == "Batch":
+            return self.batch_find(self.board.owner.candidate_pairs(), max_len=max_len)
+
+        # dfs/bfs/ucs/astar đọc max_len trong lúc tìm nên không mở rộng trạng thái đã vượt giới hạn
+        saved_len, self.max_len = self.max_len, max_len
+        try:
+            # Chỉ xét các cặp cùng icon (chỉ mục icon -> vị trí của Board)
+            for (r1, c1), (r2, c2) in self.board.owner.candidate_pairs():
+                # Tạm thời tắt simulation mode để tìm đường đi nhanh
+                temp_simulation_mode = self.simulation_mode
+                self.simulation_mode = False
+
+                path = None
+                if algo == "DFS":
+                    path = self.dfs((r1, c1), (r2, c2))
+                elif algo == "BFS":
+                    path = self.bfs((r1, c1), (r2, c2))
+                elif algo == "UCS":
+                    path = self.ucs((r1, c1), (r2, c2))
+                elif algo == "A*":
+                    path = self.astar((r1, c1), (r2, c2))
+                elif algo == "HillClimb":
+                    path = self.hill_climb((r1, c1), (r2, c2))
+                elif algo == "Ray":
+                    path = self.ray_path((r1, c1), (r2, c2))
+                elif algo == "Bi-BFS":
+                    path = self.bibfs((r1, c1), (r2, c2))
+                elif algo == "Segments":
+                    path = self.segment_path((r1, c1), (r2, c2))
+
+                # Khôi phục simulation mode
+                self.simulation_mode = temp_simulation_mode
+
+                if path and (max_len is None or len(path) <= max_len):  # Giới hạn độ dài đường đi
+                    return (r1, c1), (r2, c2), path
+        finally:
+            self.max_len = saved_len
+        return None
+
+    def _find_traced_pair(self, algo, max_len):
+        """Như find_pair nhưng mỗi cặp được thử bằng search(..., trace=True).
+
+        Đường ngắn nhất của ray_connect là cận dưới độ dài đường của mọi engine (cùng luật rẽ), nên
+        cặp Ray không nối được trong max_len ô bị bỏ qua mà không cần search. Ray / Batch thì bản
+        thân search đã là lần bắn tia đó.
+        """
+        saved_len, self.max_len = self.max_len, max_len
+        try:
+            for start, goal in self.board.owner.candidate_pairs():
+                if algo not in ("Ray", "Batch"):
+                    corners = self.ray_connect(start, goal)
+                    if not corners or (max_len is not None and self.stats['steps'] + 1 > max_len):
+                        continue
+                path, _, recorded = self.search(start, goal, algo, trace=True)
+                if path and (max_len is None or len(path) <= max_len):
+                    return start, goal, path, recorded
+        finally:
+            self.max_len = saved_len
         return None
 
-    # Các phương thức (DFS, BFS, UCS, A*) giờ chỉ dùng khi không simulation
+    # Các phương thức (DFS, BFS, UCS, A*) giờ chỉ dùng khi không simulation.
+    # Frontier chỉ giữ trạng thái (ô * 4 + hướng) * 3 + số lần rẽ; ô cha suy ra từ hướng đi vào ô và
+    # đường đi được dựng lại một lần khi tới goal. Đánh dấu visited/generated, mảng parent và
+    # frontier lấy từ SearchWorkspace dùng lại giữa các lần gọi (find_pair gọi hàng trăm lần mỗi nước).
     def dfs(self, start, goal):
         if self.simulation_mode:
             return None
         start_time = time.time()
-        self.stats = {'steps': 0, 'visited': 0, 'generated': 0, 'time_ms': 0}
-
-        stack = [(start, [start], 0)]
-        visited = set()
-        generated = set([start])
-        self.stats['generated'] = 1
+        stats = self._reset_stats()
+
+        grid, offsets = self.grid, self.offsets
+        source, target = self._index(start), self._index(goal)
+        ws = self._workspace()
+        epoch, seen, opened, parent, depth = ws.epoch, ws.visited, ws.generated, ws.parent, ws.depth
+        max_turns, fits = self.max_turns, self._length_bound(target)
+        stack = ws.stack
+        stack.clear()
+        stack.append(source * 12)
+        opened[source] = epoch
+        visited, generated = 0, 1
 
         while stack:
-            (r, c), path, turns = stack.pop()
-
-            if (r, c) in visited:
+            s = stack.pop()
+            i = s // 12
+            if seen[i] == epoch:
                 continue
-            visited.add((r, c))
-            self.stats['visited'] = len(visited)
-
-            if (r, c) == goal and self.count_turns(path) <= 2:
-                self.stats['steps'] = len(path) - 1
-                self.stats['visited'] = len(visited)
-                self.stats['generated'] = len(generated)
-                self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
+            turns = s % 3
+            d = -1 if i == source else s // 3 % 4
+            seen[i] = epoch
+            visited += 1
+            if d >= 0:
+                parent[i] = i - offsets[d]
+                depth[i] = depth[parent[i]] + 1
+            else:
+                parent[i], depth[i] = -1, 0
+
+            if i == target and turns <= max_turns:
+                path = self._cell_path(parent, i)
+                stats['steps'] = len(path) - 1
+                stats['visited'] = visited
+                stats['generated'] = generated
+                stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
                 return path
 
-            for nr, nc, dr, dc in self.neighbors(r, c):
-                if self.board[nr][nc] == -1 or (nr, nc) == goal:
-                    new_path = path + [(nr, nc)]
-                    new_turns = self.count_turns(new_path)
-                    if new_turns <= 2:
-                        stack.append(((nr, nc), new_path, new_turns))
-                        if (nr, nc) not in generated:
-                            generated.add((nr, nc))
-                            self.stats['generated'] = len(generated)
-
-        self.stats['visited'] = len(visited)
-        self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
+            for nd, offset in enumerate(offsets):
+                n = i + offset
+                if grid[n] == EMPTY or n == target:
+                    new_turns = turns if d < 0 or d == nd else turns + 1
+                    if new_turns <= max_turns and (fits is None or fits(n, depth[i] + 1)):
+                        stack.append((n * 4 + nd) * 3 + new_turns)
+                        if opened[n] != epoch:
+                            opened[n] = epoch
+                            generated += 1
+
+        stats['visited'] = visited
+        stats['generated'] = generated
+        stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
         return None
 
     def bfs(self, start, goal):
         if self.simulation_mode:
             return None
         start_time = time.time()
-        self.stats = {'steps': 0, 'visited': 0, 'generated': 0, 'time_ms': 0}
-
-        queue = deque([(start, [start], 0)])
-        visited = set()
-        generated = set([start])
-        self.stats['generated'] = 1
+        stats = self._reset_stats()
+
+        grid, offsets = self.grid, self.offsets
+        source, target = self._index(start), self._index(goal)
+        ws = self._workspace()
+        epoch, seen, opened, parent, depth = ws.epoch, ws.visited, ws.generated, ws.parent, ws.depth
+        max_turns, fits = self.max_turns, self._length_bound(target)
+        queue = ws.queue
+        queue.clear()
+        queue.append(source * 12)
+        opened[source] = epoch
+        visited, generated = 0, 1
 
         while queue:
-            (r, c), path, turns = queue.popleft()
-
-            if (r, c) in visited:
+            s = queue.popleft()
+            i = s // 12
+            if seen[i] == epoch:
                 continue
-            visited.add((r, c))
-            self.stats['visited'] = len(visited)
-
-            if (r, c) == goal and self.count_turns(path) <= 2:
-                self.stats['steps'] = len(path) - 1
-                self.stats['visited'] = len(visited)
-                self.stats['generated'] = len(generated)
-                self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
+            turns = s % 3
+            d = -1 if i == source else s // 3 % 4
+            seen[i] = epoch
+            visited += 1
+            if d >= 0:
+                parent[i] = i - offsets[d]
+                depth[i] = depth[parent[i]] + 1
+            else:
+                parent[i], depth[i] = -1, 0
+
+            if i == target and turns <= max_turns:
+                path = self._cell_path(parent, i)
+                stats['steps'] = len(path) - 1
+                stats['visited'] = visited
+                stats['generated'] = generated
+                stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
                 return path
 
-            for nr, nc, dr, dc in self.neighbors(r, c):
-                if self.board[nr][nc] == -1 or (nr, nc) == goal:
-                    new_path = path + [(nr, nc)]
-                    new_turns = self.count_turns(new_path)
-                    if new_turns <= 2:
-                        queue.append(((nr, nc), new_path, new_turns))
-                        if (nr, nc) not in generated:
-                            generated.add((nr, nc))
-                            self.stats['generated'] = len(generated)
-
-        self.stats['visited'] = len(visited)
-        self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
+            for nd, offset in enumerate(offsets):
+                n = i + offset
+                if grid[n] == EMPTY or n == target:
+                    new_turns = turns if d < 0 or d == nd else turns + 1
+                    if new_turns <= max_turns and (fits is None or fits(n, depth[i] + 1)):
+                        queue.append((n * 4 + nd) * 3 + new_turns)
+                        if opened[n] != epoch:
+                            opened[n] = epoch
+                            generated += 1
+
+        stats['visited'] = visited
+        stats['generated'] = generated
+        stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
         return None
 
     def ucs(self, start, goal):
         if self.simulation_mode:
             return None
         start_time = time.time()
-        self.stats = {'steps': 0, 'visited': 0, 'generated': 0, 'time_ms': 0}
-
-        pq = [(0, start, [start], 0)]
-        visited = set()
-        generated = set([start])
-        self.stats['generated'] = 1
-
-        while pq:
-            cost, (r, c), path, turns = heapq.heappop(pq)
-
-            if (r, c) in visited:
+        stats = self._reset_stats()
+
+        grid, offsets = self.grid, self.offsets
+        source, target = self._index(start), self._index(goal)
+        ws = self._workspace()
+        epoch, seen, opened, parent = ws.epoch, ws.visited, ws.generated, ws.parent
+        # dùng thẳng các bucket của BucketQueue (tự giữ con trỏ khóa và số phần tử đang chờ)
+        # để vòng lặp nóng không phải gọi push/pop; khóa là cost * 3 + số lần rẽ như _simulate_ucs
+        max_turns, fits = self.max_turns, self._length_bound(target)
+        ws.buckets.clear()
+        buckets, mask = ws.buckets.buckets, ws.buckets.mask
+        key, pending = 0, 1
+        buckets[0].append(source * 12)
+        opened[source] = epoch
+        visited, generated = 0, 1
+
+        while pending:
+            while not buckets[key & mask]:
+                key += 1
+            s = buckets[key & mask].popleft()
+            pending -= 1
+            i = s // 12
+            if seen[i] == epoch:
                 continue
-            visited.add((r, c))
-            self.stats['visited'] = len(visited)
-
-            if (r, c) == goal and self.count_turns(path) <= 2:
-                self.stats['steps'] = len(path) - 1
-                self.stats['visited'] = len(visited)
-                self.stats['generated'] = len(generated)
-                self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
+            cost, turns = key // 3, s % 3
+            d = -1 if i == source else s // 3 % 4
+            seen[i] = epoch
+            visited += 1
+            parent[i] = i - offsets[d] if d >= 0 else -1
+
+            if i == target and turns <= max_turns:
+                path = self._cell_path(parent, i)
+                stats['steps'] = len(path) - 1
+                stats['visited'] = visited
+                stats['generated'] = generated
+                stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
                 return path
 
-            for nr, nc, dr, dc in self.neighbors(r, c):
-                if self.board[nr][nc] == -1 or (nr, nc) == goal:
-                    new_path = path + [(nr, nc)]
-                    new_turns = self.count_turns(new_path)
-                    if new_turns <= 2:
-                        heapq.heappush(pq, (cost + 1, (nr, nc), new_path, new_turns))
-                        if (nr, nc) not in generated:
-                            generated.add((nr, nc))
-                            self.stats['generated'] = len(generated)
-
-        self.stats['visited'] = len(visited)
-        self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
+            for nd, offset in enumerate(offsets):
+                n = i + offset
+                if grid[n] == EMPTY or n == target:
+                    new_turns = turns if d < 0 or d == nd else turns + 1
+                    if new_turns <= max_turns and (fits is None or fits(n, cost + 1)):
+                        buckets[(3 * (cost + 1) + new_turns) & mask].append((n * 4 + nd) * 3 + new_turns)
+                        pending += 1
+                        if opened[n] != epoch:
+                            opened[n] = epoch
+                            generated += 1
+
+        stats['visited'] = visited
+        stats['generated'] = generated
+        stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
         return None
 
     def astar(self, start, goal):
         if self.simulation_mode:
             return None
         start_time = time.time()
-        self.stats = {'steps': 0, 'visited': 0, 'generated': 0, 'time_ms': 0}
-
-        def h(a, b):
-            return abs(a[0] - b[0]) + abs(a[1] - b[1])
-
-        pq = [(h(start, goal), 0, start, [start], 0)]
-        visited = set()
-        generated = set([start])
-        self.stats['generated'] = 1
-
-        while pq:
-            f, g, (r, c), path, turns = heapq.heappop(pq)
-
-            if (r, c) in visited:
+        stats = self._reset_stats()
+
+        grid, offsets = self.grid, self.offsets
+        source, target = self._index(start), self._index(goal)
+        width = self.width
+        goal_r, goal_c = divmod(target, width)
+
+        def h(i):
+            r, c = divmod(i, width)
+            return abs(r - goal_r) + abs(c - goal_c)
+        need = self._turn_bound(target)
+
+        max_turns = self.max_turns
+        limit = len(grid) if self.max_len is None else self.max_len - 1  # số bước tối đa
+        ws = self._workspace()
+        epoch, seen, opened, parent = ws.epoch, ws.visited, ws.generated, ws.parent
+        ws.buckets.clear()
+        buckets, mask = ws.buckets.buckets, ws.buckets.mask
+        key, pending = 3 * h(source), 1
+        buckets[key & mask].append(source * 12)
+        opened[source] = epoch
+        visited, generated = 0, 1
+
+        while pending:
+            while not buckets[key & mask]:
+                key += 1
+            s = buckets[key & mask].popleft()
+            pending -= 1
+            i = s // 12
+            if seen[i] == epoch:
                 continue
-            visited.add((r, c))
-            self.stats['visited'] = len(visited)
-
-            if (r, c) == goal and self.count_turns(path) <= 2:
-                self.stats['steps'] = len(path) - 1
-                self.stats['visited'] = len(visited)
-                self.stats['generated'] = len(generated)
-                self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
+            turns = s % 3
+            d = -1 if i == source else s // 3 % 4
+            g = key // 3 - h(i)
+            seen[i] = epoch
+            visited += 1
+            parent[i] = i - offsets[d] if d >= 0 else -1
+
+            if i == target and turns <= max_turns:
+                path = self._cell_path(parent, i)
+                stats['steps'] = len(path) - 1
+                stats['visited'] = visited
+                stats['generated'] = generated
+                stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
                 return path
 
-            for nr, nc, dr, dc in self.neighbors(r, c):
-                if self.board[nr][nc] == -1 or (nr, nc) == goal:
-                    new_path = path + [(nr, nc)]
-                    new_turns = self.count_turns(new_path)
-                    if new_turns <= 2:
-                        new_g = g + 1
-                        heapq.heappush(pq, (new_g + h((nr, nc), goal), new_g, (nr, nc), new_path, new_turns))
-                        if (nr, nc) not in generated:
-                            generated.add((nr, nc))
-                            self.stats['generated'] = len(generated)
-
-        self.stats['visited'] = len(visited)
-        self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
+            for nd, offset in enumerate(offsets):
+                n = i + offset
+                if grid[n] == EMPTY or n == target:
+                    new_turns = turns if d < 0 or d == nd else turns + 1
+                    new_g = g + 1
+                    if new_turns + need(n, nd) <= max_turns and new_g + h(n) <= limit:
+                        buckets[(3 * (new_g + h(n)) + new_turns) & mask].append((n * 4 + nd) * 3 + new_turns)
+                        pending += 1
+                        if opened[n] != epoch:
+                            opened[n] = epoch
+                            generated += 1
+
+        stats['visited'] = visited
+        stats['generated'] = generated
+        stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
         return None
+
     def hill_climb(self, start, goal):
         """Non-simulated hill-climbing path: greedy neighbor selection by Manhattan distance.
         Returns path or None. Updates self.stats similarly to other methods."""
@@ -587,30 +981,37 @@ class SearchAlgorithms:
         start_time = time.time()
         self.stats = {'steps': 0, 'visited': 0, 'generated': 0, 'time_ms': 0}
 
-        def h(a, b):
-            return abs(a[0] - b[0]) + abs(a[1] - b[1])
+        grid, offsets, width = self.grid, self.offsets, self.width
+        target = self._index(goal)
+        goal_r, goal_c = divmod(target, width)
 
-        current = start
-        path = [start]
+        def h(i):
+            r, c = divmod(i, width)
+            return abs(r - goal_r) + abs(c - goal_c)
+
+        parent = array('i', [-1]) * len(grid)
+        current = self._index(start)
+        d, turns = -1, 0
         visited = set([current])
-        generated = set([start])
+        generated = set([current])
 
         while True:
-            if current == goal and self.count_turns(path) <= 2:
+            if current == target and turns <= self.max_turns:
+                path = self._cell_path(parent, current)
                 self.stats['steps'] = len(path) - 1
                 self.stats['visited'] = len(visited)
                 self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
                 return path
 
             neighbors = []
-            for nr, nc, dr, dc in self.neighbors(current[0], current[1]):
-                if self.board[nr][nc] == -1 or (nr, nc) == goal:
-                    if (nr, nc) not in visited:
-                        new_path = path + [(nr, nc)]
-                        new_turns = self.count_turns(new_path)
-                        if new_turns <= 2:
-                            neighbors.append(((nr, nc), new_path, new_turns))
-                            generated.add((nr, nc))
+            for nd, offset in enumerate(offsets):
+                n = current + offset
+                if grid[n] == EMPTY or n == target:
+                    if n not in visited:
+                        new_turns = turns if d < 0 or d == nd else turns + 1
+                        if new_turns <= self.max_turns:
+                            neighbors.append((n, nd, new_turns))
+                            generated.add(n)
 
             self.stats['generated'] = len(generated)
 
@@ -619,13 +1020,912 @@ class SearchAlgorithms:
                 self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
                 return None
 
-            neighbors.sort(key=lambda x: h(x[0], goal))
-            best, best_path, best_turns = neighbors[0]
-            if h(best, goal) >= h(current, goal):
+            neighbors.sort(key=lambda x: h(x[0]))
+            best, best_d, best_turns = neighbors[0]
+            if h(best) >= h(current):
                 self.stats['visited'] = len(visited)
                 self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
                 return None
 
-            current = best
-            path = best_path
-            visited.add(current)
\ No newline at end of file
+            parent[best] = current
+            current, d, turns = best, best_d, best_turns
+            visited.add(current)
+
+    # ---------- 0-1 BFS trên không gian (ô, hướng, số lần rẽ) ----------
+    def _state_path(self, parent, state, start):
+        """Dựng lại đường đi từ mảng parent (chỉ số trạng thái), đi ngược về start."""
+        path = []
+        while state >= 0:
+            path.append(self._pos(state // 12))
+            state = parent[state]
+        path.append(start)
+        path.reverse()
+        return path
+
+    def _bfs01(self, start, goal):
+        """Chạy _bfs01_steps không trace (generator không yield lần nào) và lấy đường đi trả về."""
+        try:
+            next(self._bfs01_steps(start, goal))
+        except StopIteration as done:
+            return done.value
+
+    def _bfs01_steps(self, start, goal, trace=False):
+        """0-1 BFS: đi thẳng giữ nguyên tầng, rẽ thì sang tầng turns + 1 (tối đa max_turns).
+
+        Trạng thái s = (ô * 4 + hướng) * 3 + turns, nên không gian bị chặn bởi 4 x 3 x số ô.
+        Một (ô, hướng) chỉ được đẩy lại khi tới với ít lần rẽ hơn, nên đường trả về luôn có
+        số lần rẽ nhỏ nhất. Với trace=True các sự kiện simulation được yield dần.
+        """
+        start_time = time.time()
+        self.stats = {'steps': 0, 'visited': 0, 'generated': 1, 'time_ms': 0}
+        grid, offsets, max_turns = self.grid, self.offsets, self.max_turns
+        source, target = self._index(start), self._index(goal)
+        size = len(grid) * 4
+        best = [3] * size              # số lần rẽ nhỏ nhất đã đẩy cho (ô, hướng)
+        parent = array('i', [-1]) * (size * 3)  # -1: trạng thái nối trực tiếp từ start
+
+        if trace:
+            self._trace_path = lambda link, pos: self._state_path(parent, link, start)
+            self._trace_links = (parent, 12)
+        frontier = deque()
+        for d, offset in enumerate(offsets):
+            n = source + offset
+            if grid[n] == EMPTY or n == target:
+                key = n * 4 + d
+                best[key] = 0
+                frontier.append(key * 3)
+                self.stats['generated'] += 1
+
+        while frontier:
+            state = frontier.popleft()
+            key, turns = divmod(state, 3)
+            if best[key] < turns:
+                continue
+            i, d = divmod(key, 4)
+            self.stats['visited'] += 1
+            if trace:
+                yield "visit", self._pos(i), state, turns
+
+            if i == target:
+                path = self._state_path(parent, state, start)
+                self.stats['steps'] = len(path) - 1
+                self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
+                if trace:
+                    yield "goal", goal, path, turns
+                return path
+
+            for nd, offset in enumerate(offsets):
+                n = i + offset
+                if not (grid[n] == EMPTY or n == target):
+                    continue
+                new_turns = turns if nd == d else turns + 1
+                nkey = n * 4 + nd
+                if new_turns > max_turns or best[nkey] <= new_turns:
+                    continue
+                best[nkey] = new_turns
+                new_state = nkey * 3 + new_turns
+                parent[new_state] = state
+                if new_turns == turns:
+                    frontier.appendleft(new_state)
+                else:
+                    frontier.append(new_state)
+                self.stats['generated'] += 1
+                if trace:
+                    yield "expand", self._pos(n), new_state, new_turns
+
+        self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
+        return None
+
+    def bfs01(self, start, goal):
+        """0-1 BFS theo hướng: đường đi có số lần rẽ ít nhất (≤2), hoặc None."""
+        if self.simulation_mode:
+            return None
+        return self._bfs01(start, goal)
+
+    # ===== Tìm kiếm hai chiều trên không gian (ô, hướng, số lần rẽ) =====
+    def _bibfs(self, start, goal):
+        try:
+            next(self._bibfs_steps(start, goal))
+        except StopIteration as done:
+            return done.value
+
+    def _bibfs_steps(self, start, goal, trace=False):
+        """0-1 BFS đồng thời từ start (phía 0) và từ goal (phía 1), mỗi lượt mở rộng phía có
+        frontier nhỏ hơn.
+
+        Trạng thái giống _bfs01; ở phía goal hướng là hướng đi từ goal tới ô. Hai phía gặp nhau
+        tại ô trống x khi turns_0 + turns_1 (+1 nếu phải rẽ tại x) <= max_turns. Với trace=True các sự
+        kiện được yield dần; sự kiện phía goal không mang link (không vẽ đường tạm).
+        """
+        start_time = time.time()
+        self.stats = {'steps': 0, 'visited': 0, 'generated': 2, 'time_ms': 0}
+        grid, offsets, max_turns = self.grid, self.offsets, self.max_turns
+        source, target = self._index(start), self._index(goal)
+        ends = ((source, target), (target, source))
+        size = len(grid) * 4
+        best = ([3] * size, [3] * size)
+        parent = (array('i', [-1]) * (size * 3), array('i', [-1]) * (size * 3))
+        frontiers = (deque(), deque())
+        if trace:
+            self._trace_path = lambda link, pos: self._state_path(parent[0], link, start)
+            self._trace_links = (parent[0], 12)
+
+        def finish(state, side, meet):
+            """Ghép nửa đường của phía side (tới state) với nửa kia (trạng thái meet, hoặc None
+            nếu state đã là đầu bên kia)."""
+            half = self._state_path(parent[side], state, (start, goal)[side])
+            if meet is not None:
+                other = self._state_path(parent[1 - side], meet, (start, goal)[1 - side])
+                half += reversed(other[:-1])
+            path = half if side == 0 else half[::-1]
+            self.stats['steps'] = len(path) - 1
+            self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
+            return path
+
+        def meeting(n, nd, turns, side):
+            """Trạng thái phía bên kia tại ô n nối được với (n, nd, turns) trong ngân sách max_turns lần rẽ."""
+            other = best[1 - side]
+            for od in range(4):
+                other_turns = other[n * 4 + od]
+                # hai phía cùng đi vào n; đường liền mạch rẽ tại n khi nd khác hướng ngược od
+                if other_turns + turns + (nd != od ^ 1) <= max_turns:
+                    return (n * 4 + od) * 3 + other_turns
+            return None
+
+        for side in (0, 1):
+            origin, other_end = ends[side]
+            for d, offset in enumerate(offsets):
+                n = origin + offset
+                if n == other_end:
+                    path = [start, goal]
+                    if trace:
+                        yield "goal", goal, path, 0
+                    self.stats['steps'] = 1
+                    return path
+                if grid[n] == EMPTY:
+                    key = n * 4 + d
+                    best[side][key] = 0
+                    frontiers[side].append(key * 3)
+                    self.stats['generated'] += 1
+
+        while frontiers[0] and frontiers[1]:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            frontier, side_best, side_parent = frontiers[side], best[side], parent[side]
+            other_end = ends[side][1]
+            state = frontier.popleft()
+            key, turns = divmod(state, 3)
+            if side_best[key] < turns:
+                continue
+            i, d = divmod(key, 4)
+            self.stats['visited'] += 1
+            if trace:
+                yield "visit", self._pos(i), state if side == 0 else None, turns
+
+            for nd, offset in enumerate(offsets):
+                n = i + offset
+                new_turns = turns if nd == d else turns + 1
+                if new_turns > max_turns:
+                    continue
+                nkey = n * 4 + nd
+                new_state = nkey * 3 + new_turns
+                if n == other_end:
+                    # một phía tự đi tới đầu bên kia
+                    side_parent[new_state] = state
+                    path = finish(new_state, side, None)
+                elif grid[n] != EMPTY or side_best[nkey] <= new_turns:
+                    continue
+                else:
+                    side_best[nkey] = new_turns
+                    side_parent[new_state] = state
+                    if new_turns == turns:
+                        frontier.appendleft(new_state)
+                    else:
+                        frontier.append(new_state)
+                    self.stats['generated'] += 1
+                    if trace:
+                        yield "expand", self._pos(n), new_state if side == 0 else None, new_turns
+                    meet = meeting(n, nd, new_turns, side)
+                    if meet is None:
+                        continue
+                    path = finish(new_state, side, meet)
+                if trace:
+                    yield "goal", goal, path, self.count_turns(path)
+                return path
+
+        self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
+        return None
+
+    def bibfs(self, start, goal):
+        """Tìm kiếm hai chiều: đường đi ≤2 lần rẽ (không nhất thiết ngắn nhất), hoặc None."""
+        if self.simulation_mode:
+            return None
+        return self._bibfs(start, goal)
+
+    def find_matches(self, start):
+        """Quét một lần vùng đi được với ≤2 lần rẽ từ start (0-1 BFS như _bfs01, không có goal).
+
+        Mọi ô cùng icon được đẩy vào frontier như goal của _bfs01 nhưng không bao giờ mở rộng
+        tiếp, nên đường tới từng ô giống hệt khi gọi bfs01 cho riêng cặp đó.
+        Trả về {ô cùng icon: đường đi} cho mọi ô cùng icon nối được.
+        """
+        start_time = time.time()
+        self.stats = {'steps': 0, 'visited': 0, 'generated': 1, 'time_ms': 0}
+        grid, offsets, max_turns = self.grid, self.offsets, self.max_turns
+        source = self._index(start)
+        icon = grid[source]
+        size = len(grid) * 4
+        best = [3] * size
+        parent = array('i', [-1]) * (size * 3)
+        matches = {}
+
+        frontier = deque()
+        for d, offset in enumerate(offsets):
+            n = source + offset
+            if grid[n] == EMPTY or grid[n] == icon:
+                best[n * 4 + d] = 0
+                frontier.append((n * 4 + d) * 3)
+                self.stats['generated'] += 1
+
+        while frontier:
+            state = frontier.popleft()
+            key, turns = divmod(state, 3)
+            if best[key] < turns:
+                continue
+            i, d = divmod(key, 4)
+            self.stats['visited'] += 1
+            if grid[i] == icon:
+                pos = self._pos(i)
+                if pos not in matches:
+                    matches[pos] = self._state_path(parent, state, start)
+                continue
+
+            for nd, offset in enumerate(offsets):
+                n = i + offset
+                if not (grid[n] == EMPTY or (grid[n] == icon and n != source)):
+                    continue
+                new_turns = turns if nd == d else turns + 1
+                nkey = n * 4 + nd
+                if new_turns > max_turns or best[nkey] <= new_turns:
+                    continue
+                best[nkey] = new_turns
+                new_state = nkey * 3 + new_turns
+                parent[new_state] = state
+                if new_turns == turns:
+                    frontier.appendleft(new_state)
+                else:
+                    frontier.append(new_state)
+                self.stats['generated'] += 1
+
+        self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
+        return matches
+
+    # ---------- Ray casting (≤2 turns) ----------
+    def _ray(self, i, d):
+        """Các chỉ số ô trống liên tiếp từ i theo hướng d, lấy từ con trỏ ô có icon gần nhất."""
+        offset = self.offsets[d]
+        return range(i + offset, self.owner.nearest(i, d), offset)
+
+    def cast_rays(self, pos):
+        """Trả về {hướng: [ô]} gồm các ô trống liên tiếp nhìn thấy thẳng từ pos theo 4 hướng."""
+        i = self._index(pos)
+        return {direction: [self._pos(n) for n in self._ray(i, d)]
+                for d, direction in enumerate(self.DIRECTIONS)}
+
+    def _segment_clear(self, a, b):
+        """Như line_clear nhưng trên chỉ số ô của bảng phẳng (tra con trỏ của Board)."""
+        return self.owner.segment_clear(a, b)
+
+    def line_clear(self, a, b):
+        """True nếu a, b cùng hàng/cột và mọi ô nằm giữa (không tính hai đầu) đều trống."""
+        return self._segment_clear(self._index(a), self._index(b))
+
+    def ray_connect(self, start, goal):
+        """Kiểm tra start và goal có nối được với ≤2 lần rẽ (dạng I/L/Z/U) bằng cách bắn tia thẳng.
+
+        Trả về danh sách điểm góc [start, (góc...), goal] của đường ngắn nhất, hoặc None. Dạng L
+        (1 lần rẽ) và Z/U (2 lần rẽ) chỉ được xét khi max_turns cho phép.
+        """
+        start_time = time.time()
+        self.stats = {'steps': 0, 'visited': 0, 'generated': 0, 'time_ms': 0}
+        grid, width, max_turns = self.grid, self.width, self.max_turns
+        (r1, c1), (r2, c2) = start, goal
+        s, t = self._index(start), self._index(goal)
+        candidates = []
+
+        # I: cùng hàng / cùng cột
+        if (r1 == r2 or c1 == c2) and self._segment_clear(s, t):
+            candidates.append([s, t])
+
+        # L: một góc tại (r1, c2) hoặc (r2, c1)
+        for corner in (s + (c2 - c1), t + (c1 - c2)) if max_turns >= 1 else ():
+            if grid[corner] == EMPTY:
+                self.stats['generated'] += 1
+                if self._segment_clear(s, corner) and self._segment_clear(corner, t):
+                    candidates.append([s, corner, t])
+
+        # Z/U: góc thứ nhất nằm trên tia của start, góc thứ hai trên tia của goal.
+        # Tia của goal là khoảng mở giữa hai ô có icon gần nhất theo mỗi trục.
+        owner = self.owner
+        goal_rays = ((owner.nearest(t, 1), owner.nearest(t, 0)), (owner.nearest(t, 3), owner.nearest(t, 2)))
+        self.stats['visited'] += sum(len(self._ray(t, d)) for d in range(4))
+        for d in range(4 if max_turns >= 2 else 0):
+            # tia dọc (d = 0, 1) -> đoạn giữa nằm ngang, tia ngang -> đoạn giữa thẳng đứng
+            shift = (c2 - c1) if d < 2 else (r2 - r1) * width
+            if shift == 0:
+                continue
+            low, high = goal_rays[d // 2]
+            cells = self._ray(s, d)
+            self.stats['visited'] += len(cells)
+            for first in cells:
+                second = first + shift
+                if not low < second < high or second == t:
+                    continue
+                self.stats['generated'] += 1
+                if self._segment_clear(first, second):
+                    candidates.append([s, first, second, t])
+
+        best = None
+        best_len = 0
+        for corners in candidates:
+            length = 0
+            for a, b in zip(corners, corners[1:]):
+                length += abs(a // width - b // width) + abs(a % width - b % width)
+            if best is None or length < best_len:
+                best, best_len = corners, length
+
+        if best:
+            self.stats['steps'] = best_len
+            best = [self._pos(i) for i in best]
+        self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
+        return best
+
+    def corners_to_path(self, corners):
+        """Trải danh sách điểm góc thành đường đi từng ô (dùng để vẽ và tính cost)."""
+        path = [corners[0]]
+        for (r, c), (tr, tc) in zip(corners, corners[1:]):
+            dr = (tr > r) - (tr < r)
+            dc = (tc > c) - (tc < c)
+            while (r, c) != (tr, tc):
+                r, c = r + dr, c + dc
+                path.append((r, c))
+        return path
+
+    def ray_path(self, start, goal):
+        """Giống dfs/bfs/...: trả về đường đi từng ô hoặc None, dùng engine ray casting."""
+        if self.simulation_mode:
+            return None
+        corners = self.ray_connect(start, goal)
+        return self.corners_to_path(corners) if corners else None
+
+    @property
+    def segment_graph(self):
+        """SegmentGraph của bảng hiện tại, tạo khi dùng lần đầu và tự đồng bộ theo Board."""
+        if self._segment_graph is None:
+            self._segment_graph = SegmentGraph(self)
+        return self._segment_graph
+
+    def segment_path(self, start, goal):
+        """Giống ray_path nhưng tìm trên đồ thị các dải ô trống (engine "Segments")."""
+        if self.simulation_mode:
+            return None
+        corners = self.segment_graph.connect(start, goal)
+        return self.corners_to_path(corners) if corners else None
+
+    # ===== Engine "Batch": kiểm tra cả lô cặp bằng NumPy và tổng tiền tố =====
+    def batch_connect(self, pairs):
+        """Như ray_connect nhưng cho cả danh sách cặp [(start, goal), ...] cùng lúc.
+
+        Mọi đường ≤2 lần rẽ trong bảng có dạng start -> (k, c1) -> (k, c2) -> goal (đoạn giữa
+        nằm ngang ở hàng k) hoặc start -> (r1, k) -> (r2, k) -> goal (đoạn giữa thẳng đứng ở
+        cột k); I và L là các trường hợp góc trùng điểm đầu/cuối. Với tổng tiền tố số ô có icon
+        theo hàng và theo cột, mỗi đoạn được kiểm tra bằng một phép trừ, cho mọi cặp và mọi k
+        cùng lúc. Chọn đường ngắn nhất, hòa thì theo đúng thứ tự ứng viên của ray_connect,
+        nên kết quả trùng với ray_connect. Không có NumPy, hoặc max_turns < 2 (các k trên luôn
+        gồm cả đường 2 lần rẽ), thì gọi ray_connect từng cặp.
+        """
+        if np is None or self.max_turns < 2:
+            return [self.ray_connect(start, goal) for start, goal in pairs]
+        start_time = time.time()
+        self.stats = {'steps': 0, 'visited': len(pairs), 'generated': 0, 'time_ms': 0}
+        width = self.width
+        occupied = np.frombuffer(self.grid, dtype=np.int8).reshape(-1, width) != EMPTY
+        row_sum = np.zeros((occupied.shape[0], width + 1), dtype=np.int32)
+        np.cumsum(occupied, axis=1, out=row_sum[:, 1:])
+        col_sum = np.zeros((occupied.shape[0] + 1, width), dtype=np.int32)
+        np.cumsum(occupied, axis=0, out=col_sum[1:])
+
+        def row_clear(r, a, b):
+            return row_sum[r, np.maximum(a, b)] - row_sum[r, np.minimum(a, b) + 1] <= 0
+
+        def col_clear(c, a, b):
+            return col_sum[np.maximum(a, b), c] - col_sum[np.minimum(a, b) + 1, c] <= 0
+
+        span = max(self.rows, self.cols) + 1
+        base = 4 * span + 4  # khóa = độ dài * base + thứ tự ứng viên (I, L, rồi Z/U theo hướng tia)
+        results = []
+        for chunk in range(0, len(pairs), BATCH_CHUNK):
+            part = np.array([(r1, c1, r2, c2) for (r1, c1), (r2, c2) in pairs[chunk:chunk + BATCH_CHUNK]],
+                            dtype=np.int64).reshape(-1, 4) + 1
+            r1, c1, r2, c2 = (part[:, j:j + 1] for j in range(4))
+            keys = []
+            for horizontal in (False, True):
+                if not horizontal:   # đoạn giữa nằm ngang ở hàng k
+                    k = np.arange(1, self.rows + 1)[None, :]
+                    a, b = k == r1, k == r2
+                    ok = ((~occupied[k, c1] | a) & (~occupied[k, c2] | b) & col_clear(c1, r1, k)
+                          & row_clear(k, c1, c2) & col_clear(c2, k, r2))
+                    length = abs(r1 - k) + abs(c1 - c2) + abs(k - r2)
+                    ray = np.where(k > r1, 0, 1) * span + abs(k - r1)
+                else:                # đoạn giữa thẳng đứng ở cột k
+                    k = np.arange(1, self.cols + 1)[None, :]
+                    a, b = k == c1, k == c2
+                    ok = ((~occupied[r1, k] | a) & (~occupied[r2, k] | b) & row_clear(r1, c1, k)
+                          & col_clear(k, r1, r2) & row_clear(r2, k, c2))
+                    length = abs(c1 - k) + abs(r1 - r2) + abs(k - c2)
+                    ray = np.where(k > c1, 2, 3) * span + abs(k - c1)
+                    a, b = b, a      # góc (r1, c2) là L thứ nhất, (r2, c1) là L thứ hai
+                order = np.where(a & b, 0, np.where(a, 1, np.where(b, 2, 3 + ray)))
+                keys.append(np.where(ok, length * base + order, np.iinfo(np.int64).max))
+                self.stats['generated'] += ok.size
+            keys = np.concatenate(keys, axis=1)
+            best = keys.argmin(axis=1)
+            found = keys[np.arange(len(part)), best] != np.iinfo(np.int64).max
+            for (pr1, pc1, pr2, pc2), k, hit in zip(part.tolist(), best.tolist(), found.tolist()):
+                if not hit:
+                    results.append(None)
+                    continue
+                if k < self.rows:
+                    first, second = (k + 1, pc1), (k + 1, pc2)
+                else:
+                    first, second = (pr1, k - self.rows + 1), (pr2, k - self.rows + 1)
+                corners = [(pr1, pc1)]
+                for point in (first, second, (pr2, pc2)):
+                    if point != corners[-1]:
+                        corners.append(point)
+                results.append([(r - 1, c - 1) for r, c in corners])
+        if len(pairs) == 1 and results[0]:
+            self.stats['steps'] = len(self.corners_to_path(results[0])) - 1
+        self.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
+        return results
+
+    def batch_path(self, start, goal):
+        """Giống ray_path nhưng qua engine Batch (một lô gồm một cặp)."""
+        if self.simulation_mode:
+            return None
+        corners = self.batch_connect([(start, goal)])[0]
+        return self.corners_to_path(corners) if corners else None
+
+    def batch_find(self, pairs, max_len=None):
+        """Cặp đầu tiên (theo thứ tự pairs) nối được, kiểm tra cả lô cùng lúc: (start, goal, path) hoặc None."""
+        pairs = list(pairs)
+        for (start, goal), corners in zip(pairs, self.batch_connect(pairs)):
+            if corners:
+                path = self.corners_to_path(corners)
+                if max_len is None or len(path) <= max_len:
+                    return start, goal, path
+        return None
+
+
+class SearchWorkspace:
+    """Mảng làm việc cho dfs/bfs/ucs/astar, cấp phát một lần theo số ô của bảng phẳng.
+
+    visited[i] / generated[i] bằng epoch hiện tại nghĩa là ô i đã được duyệt / sinh ra trong lần
+    tìm này, nên begin() chỉ cần tăng epoch thay vì xóa mảng. parent[i] / depth[i] chỉ được đọc với
+    ô đã duyệt trong cùng lần tìm nên không cần đặt lại. Frontier (stack, queue, buckets) được dùng lại,
+    mỗi thuật toán tự làm rỗng frontier của mình trước khi tìm.
+    """
+
+    EPOCH_LIMIT = 0xFFFFFFFF  # giá trị lớn nhất của array('I')
+
+    def __init__(self, size):
+        self.visited = array('I', [0]) * size
+        self.generated = array('I', [0]) * size
+        self.parent = array('i', [-1]) * size
+        self.depth = array('i', [0]) * size  # số bước từ start, chỉ dùng khi có giới hạn độ dài
+        self.epoch = 0
+        self.stack = []
+        self.queue = deque()
+        self.buckets = BucketQueue()
+
+    def begin(self):
+        if self.epoch == self.EPOCH_LIMIT:
+            size = len(self.parent)
+            self.visited = array('I', [0]) * size
+            self.generated = array('I', [0]) * size
+            self.epoch = 0
+        self.epoch += 1
+        return self.epoch
+
+
+class BucketQueue:
+    """Hàng đợi ưu tiên vòng cho khóa nguyên không giảm theo thứ tự lấy ra (cost của UCS,
+    f của A* với h nhất quán khi mỗi bước tốn 1), với mọi khóa đang chờ nằm trong một cửa sổ
+    rộng dưới span.
+
+    Khóa k nằm ở bucket k % span (span là lũy thừa của 2) nên push/pop đều O(1) (con trỏ khóa
+    chỉ tiến lên), các phần tử cùng khóa ra theo thứ tự vào (FIFO) và không phải so sánh tuple
+    như heapq. Các bucket được tạo một lần và dùng lại sau clear().
+    """
+
+    def __init__(self, key=0, span=16):
+        self.buckets = [deque() for _ in range(span)]
+        self.mask = span - 1
+        self.key = key
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def clear(self, key=0):
+        for bucket in self.buckets:
+            bucket.clear()
+        self.key = key
+        self.size = 0
+
+    def push(self, key, item):
+        self.buckets[key & self.mask].append(item)
+        self.size += 1
+
+    def pop(self):
+        """Lấy (khóa, phần tử) có khóa nhỏ nhất, phần tử vào trước ra trước."""
+        buckets, mask, key = self.buckets, self.mask, self.key
+        while not buckets[key & mask]:
+            key += 1
+        self.key = key
+        self.size -= 1
+        return key, buckets[key & mask].popleft()
+
+
+class SegmentGraph:
+    """Đồ thị các dải ô trống: mỗi dải ô trống liên tiếp tối đa theo hàng (trục 0) hoặc theo
+    cột (trục 1) là một nút, một dải ngang và một dải dọc nối nhau khi cắt nhau tại một ô.
+
+    Đường ≤2 lần rẽ là tối đa 3 đoạn thẳng, mỗi đoạn nằm trọn trong một dải, nên nối một cặp
+    ô là tìm theo chiều rộng sâu tối đa 3 nút từ các dải kề start tới các dải kề goal.
+    Board.remove_pair chỉ nối các dải kề ô vừa xóa (gộp nhãn của dải ngắn hơn vào dải dài
+    hơn); khi Board đổi generation (reshuffle, bảng mới) hoặc là một Board khác thì dựng lại
+    như MoveCache.
+    """
+
+    def __init__(self, algorithms):
+        self.algorithms = algorithms
+        self.visited_runs = []
+        self._board = None  # Board đã dựng đồ thị: generation chỉ có nghĩa với đúng Board đó
+        self._generation = None
+        self._log_pos = 0
+
+    def rebuild(self):
+        algos = self.algorithms
+        board = algos.board.owner
+        grid, width = algos.grid, algos.width
+        # run_of[trục][ô] = id dải chứa ô trống đó, -1 nếu ô có icon / viền
+        self.run_of = (array('i', [-1]) * len(grid), array('i', [-1]) * len(grid))
+        self.first, self.last, self.axis, self.links = [], [], [], []
+        for axis, step in ((0, 1), (1, width)):
+            runs = self.run_of[axis]
+            for i in board.cells:
+                if grid[i] != EMPTY or grid[i - step] == EMPTY:
+                    continue
+                run = self._new_run(axis, i)
+                j = i
+                while grid[j] == EMPTY:
+                    runs[j] = run
+                    j += step
+                self.last[run] = j - step
+        for i in board.cells:
+            if grid[i] == EMPTY:
+                self._link(self.run_of[0][i], self.run_of[1][i])
+        self._board = board
+        self._generation = board.generation
+        self._log_pos = len(board.removed)
+
+    def _new_run(self, axis, cell):
+        self.first.append(cell)
+        self.last.append(cell)
+        self.axis.append(axis)
+        self.links.append(set())
+        return len(self.first) - 1
+
+    def _link(self, h, v):
+        self.links[h].add(v)
+        self.links[v].add(h)
+
+    def run_cells(self, run):
+        step = 1 if self.axis[run] == 0 else self.algorithms.width
+        return range(self.first[run], self.last[run] + step, step)
+
+    def _clear(self, x):
+        """Ô x vừa thành trống: nối x với dải hai bên theo mỗi trục, gộp hai dải nếu cần."""
+        if self.run_of[0][x] >= 0:
+            return
+        for axis, step in ((0, 1), (1, self.algorithms.width)):
+            runs = self.run_of[axis]
+            before, after = runs[x - step], runs[x + step]
+            if before < 0 and after < 0:
+                runs[x] = self._new_run(axis, x)
+                continue
+            if before >= 0 and after >= 0:
+                keep, drop = before, after
+                if self.last[before] - self.first[before] < self.last[after] - self.first[after]:
+                    keep, drop = after, before
+                for cell in self.run_cells(drop):
+                    runs[cell] = keep
+                for other in self.links[drop]:
+                    self.links[other].discard(drop)
+                    self._link(keep, other)
+                self.links[drop] = set()
+                self.first[keep], self.last[keep] = self.first[before], self.last[after]
+            else:
+                keep = before if before >= 0 else after
+                self.first[keep] = min(self.first[keep], x)
+                self.last[keep] = max(self.last[keep], x)
+            runs[x] = keep
+        self._link(self.run_of[0][x], self.run_of[1][x])
+
+    def sync(self):
+        board = self.algorithms.board.owner
+        if board is not self._board or board.generation != self._generation:
+            self.rebuild()
+        elif self._log_pos < len(board.removed):
+            for x in board.removed[self._log_pos:]:
+                self._clear(x)
+            self._log_pos = len(board.removed)
+
+    def _end_runs(self, cell):
+        """{dải: True} cho các dải đi thẳng vào được từ ô cell (ô kề theo trục của dải)."""
+        algos = self.algorithms
+        runs = {}
+        for d, offset in enumerate(algos.offsets):
+            run = self.run_of[1 if d < 2 else 0][cell + offset]
+            if run >= 0:
+                runs[run] = True
+        return runs
+
+    def _cross(self, a, b):
+        """Ô giao của một dải ngang và một dải dọc."""
+        h, v = (a, b) if self.axis[a] == 0 else (b, a)
+        width = self.algorithms.width
+        return self.first[h] - self.first[h] % width + self.first[v] % width
+
+    def connect(self, start, goal):
+        """Điểm góc [start, (góc...), goal] của một đường ≤max_turns lần rẽ (ít lần rẽ nhất), hoặc None."""
+        start_time = time.time()
+        self.sync()
+        algos = self.algorithms
+        algos.stats = {'steps': 0, 'visited': 0, 'generated': 0, 'time_ms': 0}
+        s, t = algos._index(start), algos._index(goal)
+        self.visited_runs = []
+        corners = None
+        if t - s in algos.offsets:
+            corners = [s, t]
+        else:
+            targets = self._end_runs(t)
+            parent = {run: None for run in self._end_runs(s)}
+            algos.stats['generated'] = len(parent)
+            layer = list(parent)
+            for depth in range(algos.max_turns + 1):  # depth = số lần rẽ của đường tới layer
+                hit = next((run for run in layer if run in targets), None)
+                if hit is not None:
+                    chain = [hit]
+                    while parent[chain[-1]] is not None:
+                        chain.append(parent[chain[-1]])
+                    chain.reverse()
+                    corners = [s] + [self._cross(a, b) for a, b in zip(chain, chain[1:])] + [t]
+                    break
+                if depth == algos.max_turns:
+                    break
+                next_layer = []
+                for run in layer:
+                    self.visited_runs.append(run)
+                    for other in self.links[run]:
+                        if other not in parent:
+                            parent[other] = run
+                            next_layer.append(other)
+                layer = next_layer
+                algos.stats['generated'] += len(next_layer)
+        algos.stats['visited'] = len(self.visited_runs)
+        if corners:
+            corners = [algos._pos(i) for i in corners]
+            algos.stats['steps'] = sum(abs(r1 - r2) + abs(c1 - c2)
+                                       for (r1, c1), (r2, c2) in zip(corners, corners[1:]))
+        algos.stats['time_ms'] = round((time.time() - start_time) * 1000, 1)
+        return corners
+
+
+class SimulationTrace:
+    """Trace simulation lưu gọn để xem lại: mỗi sự kiện là một bản ghi
+    (action, ô, sự kiện cha, turns) trong các array thay vì tuple chứa bản sao path.
+
+    Đường đi của một sự kiện là đường đi của sự kiện cha nối thêm ô của nó, được dựng lại
+    khi đọc trace[k]. Cứ KEYFRAME_DEPTH bước theo chuỗi cha lại có một keyframe lưu sẵn
+    cả đường đi, nên đọc ngẫu nhiên một sự kiện chỉ phải lần ngược tối đa KEYFRAME_DEPTH
+    bản ghi. Sự kiện goal (và các path không dựng được từ parent) luôn là keyframe.
+    """
+    ACTIONS = ("visit", "expand", "goal", "none")
+    KEYFRAME_DEPTH = 32
+    NO_PATH = -2  # sự kiện cha: sự kiện không có path (vd. các ô trên tia của Ray)
+
+    def __init__(self, algorithms, start):
+        self.algorithms = algorithms
+        self.start = algorithms._index(start)
+        self.actions = array('b')
+        self.cells = array('i')
+        self.parents = array('i')
+        self.turns = array('b')
+        self.depths = array('H')
+        self.keyframes = {}        # chỉ số sự kiện -> array các ô của cả đường đi
+        self.stats = None          # thống kê của lần tìm kiếm đã ghi (do search gán)
+        self._visit_event = None   # link (ô hoặc trạng thái) -> sự kiện visit của nó
+
+    def __len__(self):
+        return len(self.actions)
+
+    def append(self, action, pos, link, turns):
+        """Ghi một sự kiện như các generator _simulate_* sinh ra."""
+        event = len(self.actions)
+        cell = self.algorithms._index(pos) if pos is not None else -1
+        parent, depth = self.NO_PATH, 0
+        if isinstance(link, int):
+            links, unit = self.algorithms._trace_links
+            if self._visit_event is None:
+                self._visit_event = array('i', [-1]) * len(links)
+            visit_event = self._visit_event
+            if link // unit == cell:
+                # link chính là ô của sự kiện: cha là sự kiện visit của parent[link]
+                parent = visit_event[links[link]] if links[link] >= 0 else -1
+            else:
+                # link là ô đang mở rộng, ô của sự kiện là ô kề được sinh ra
+                parent = visit_event[link]
+            if action == "visit":
+                visit_event[link] = event
+            depth = self.depths[parent] + 1 if parent >= 0 else 1
+        self.actions.append(self.ACTIONS.index(action))
+        self.cells.append(cell)
+        self.parents.append(parent)
+        self.turns.append(-1 if turns is None else turns)
+        self.depths.append(min(depth, 0xFFFF))
+        if isinstance(link, list):
+            self.parents[event] = -1
+            self.keyframes[event] = array('i', [self.algorithms._index(p) for p in link])
+        elif depth and depth % self.KEYFRAME_DEPTH == 0:
+            self.keyframes[event] = array('i', self._cells(event))
+
+    def _cells(self, event):
+        cells = []
+        while event >= 0 and event not in self.keyframes:
+            cells.append(self.cells[event])
+            event = self.parents[event]
+        if event >= 0:
+            cells.extend(reversed(self.keyframes[event]))
+        elif not cells or cells[-1] != self.start:
+            cells.append(self.start)
+        cells.reverse()
+        return cells
+
+    def __getitem__(self, event):
+        """Sự kiện thứ event dạng (action, pos, path, turns) giống simulate_step."""
+        if event < 0:
+            event += len(self)
+        cell, turns = self.cells[event], self.turns[event]
+        pos = self.algorithms._pos(cell) if cell >= 0 else None
+        path = None
+        if self.parents[event] != self.NO_PATH:
+            path = [self.algorithms._pos(i) for i in self._cells(event)]
+        return self.ACTIONS[self.actions[event]], pos, path, turns if turns >= 0 else None
+
+
+class MoveCache:
+    """Tập các cặp ô đang nối được (≤2 lần rẽ) của bảng, giữ giữa các lượt đi.
+
+    Xóa ô chỉ làm bảng trống thêm nên cặp đã hợp lệ vẫn hợp lệ (trừ cặp chứa ô bị xóa);
+    sau mỗi Board.remove_pair chỉ cần kiểm tra lại các cặp có một đầu "chạm" được hàng hoặc
+    cột của ô vừa xóa. Khi Board đổi generation (reshuffle, bảng mới) hoặc algorithms được gán
+    sang một Board khác thì dựng lại toàn bộ.
+    """
+
+    def __init__(self, algorithms):
+        self.algorithms = algorithms
+        self.moves = set()      # các cặp (chỉ số ô a, chỉ số ô b) với a < b
+        self._board = None      # Board đã dựng moves: generation chỉ có nghĩa với đúng Board đó
+        self._generation = None
+        self._log_pos = 0
+
+    def _connectable(self, a, b):
+        algos = self.algorithms
+        return algos.ray_connect(algos._pos(a), algos._pos(b)) is not None
+
+    def rebuild(self):
+        board = self.algorithms.board.owner
+        self.moves = set()
+        for p, q in board.candidate_pairs():
+            a, b = board.index(*p), board.index(*q)
+            if self._connectable(a, b):
+                self.moves.add((a, b))
+        self._board = board
+        self._generation = board.generation
+        self._log_pos = len(board.removed)
+
+    def _nearest(self, i, d):
+        """Ô có icon gần nhất từ i theo hướng d, hoặc None nếu gặp viền."""
+        n = self.algorithms.owner.nearest(i, d)
+        return n if self.algorithms.grid[n] != BORDER else None
+
+    def _affected_pairs(self, x):
+        """Các cặp cùng icon có thể vừa nối được nhờ ô trống x.
+
+        Đường đi qua x thì hoặc một đầu nhìn thẳng thấy x (x nằm trên đoạn đầu/cuối), hoặc x
+        nằm trên đoạn giữa: khi đó cả hai đầu đều phải đi vuông góc tới được hàng (hoặc cột)
+        của x, tức là ô có icon gần nhất phía trên/dưới (trái/phải) một ô trống của hàng đó.
+        """
+        algos = self.algorithms
+        board = algos.board.owner
+        grid, width = algos.grid, algos.width
+        pairs = set()
+
+        for d in range(4):
+            p = self._nearest(x, d)
+            if p is not None:
+                for q in board.icon_cells[grid[p]]:
+                    if q != p:
+                        pairs.add((p, q) if p < q else (q, p))
+
+        row_start = x - x % width + 1
+        lines = ((range(row_start, row_start + board.cols), (0, 1)),
+                 (range(x % width + width, len(grid) - width, width), (2, 3)))
+        for line, across in lines:
+            groups = {}
+            for cell in line:
+                if grid[cell] != EMPTY:
+                    continue
+                for d in across:
+                    p = self._nearest(cell, d)
+                    if p is not None:
+                        groups.setdefault(grid[p], set()).add(p)
+            for cells in groups.values():
+                cells = sorted(cells)
+                for k, p in enumerate(cells):
+                    for q in cells[k + 1:]:
+                        pairs.add((p, q))
+        return pairs
+
+    def _apply_removals(self, cleared):
+        cleared = set(cleared)
+        self.moves = {m for m in self.moves if m[0] not in cleared and m[1] not in cleared}
+        checked = set()
+        for x in cleared:
+            for pair in self._affected_pairs(x):
+                if pair in self.moves or pair in checked:
+                    continue
+                checked.add(pair)
+                if self._connectable(*pair):
+                    self.moves.add(pair)
+
+    def sync(self):
+        board = self.algorithms.board.owner
+        if board is not self._board or board.generation != self._generation:
+            self.rebuild()
+        elif self._log_pos < len(board.removed):
+            self._apply_removals(board.removed[self._log_pos:])
+            self._log_pos = len(board.removed)
+
+    def has_move(self):
+        self.sync()
+        return bool(self.moves)
+
+    def get_move(self, max_len=None, trace=False):
+        """Cặp hợp lệ đầu tiên theo thứ tự quét như find_pair có đường Ray tối đa max_len ô:
+        ((r1, c1), (r2, c2), path) hoặc None.
+
+        trace=True: đường đi lấy từ search(..., "Ray", trace=True) và trả về thêm trace của lần đó.
+        """
+        self.sync()
+        algos = self.algorithms
+        for a, b in sorted(self.moves):
+            start, goal = algos._pos(a), algos._pos(b)
+            if trace:
+                path, _, recorded = algos.search(start, goal, "Ray", trace=True)
+            else:
+                path = algos.corners_to_path(algos.ray_connect(start, goal))
+            if max_len is None or len(path) <= max_len:
+                return (start, goal, path, recorded) if trace else (start, goal, path)
+        return None
@@ -0,0 +1,332 @@
+"""
+Giải trọn bàn chơi không cần reshuffle (chạy không cần giao diện):
+
+    plan = Solver(game.board).solve()      # [((r1, c1), (r2, c2)), ...] hoặc None
+    plan = BeamPlanner(game.board).plan()  # thứ tự xóa có tổng cost thấp, trong giới hạn thời gian
+    worker = PlanWorker("Beam")            # make_plan trong luồng nền, lấy kết quả bằng take(board)
+"""
+
+import heapq
+import random
+import threading
+import time
+from collections import deque
+
+from Board import Board, BitBoard, EMPTY
+from Search import SearchAlgorithms
+
+SOLVER_MAX_NODES = 5000      # số trạng thái tối đa được mở rộng trong một lần solve
+SOLVER_TABLE_SIZE = 1 << 16  # số trạng thái bế tắc tối đa giữ trong bảng chuyển vị
+BEAM_WIDTH = 4               # số trạng thái BeamPlanner giữ lại sau mỗi lần xóa
+BEAM_TIME_BUDGET = 1.0       # số giây tối đa cho một lần BeamPlanner.plan
+
+
+class Solver:
+    """DFS trên thứ tự xóa cặp để xóa sạch bảng, trên một bản sao BitBoard của Board.
+
+    Mỗi trạng thái (tập ô còn icon) được băm Zobrist: XOR khóa ngẫu nhiên của mọi cặp (ô, icon)
+    còn trên bảng, nên mỗi lần xóa / hoàn tác một cặp chỉ cần XOR hai khóa. Trạng thái đã chứng
+    minh là bế tắc được nhớ trong bảng chuyển vị có giới hạn (bỏ mục cũ nhất khi đầy), nên các thứ
+    tự xóa khác nhau dẫn tới cùng một trạng thái chỉ bị duyệt một lần.
+
+    Xóa ô chỉ làm bảng trống thêm nên cặp đang nối được vẫn nối được về sau. Vì vậy nếu một icon
+    chỉ còn đúng hai ô và hai ô đó nối được thì xóa ngay cặp đó không bao giờ làm mất lời giải:
+    cặp như vậy được xóa luôn, không rẽ nhánh.
+    """
+
+    def __init__(self, board, max_nodes=SOLVER_MAX_NODES, table_size=SOLVER_TABLE_SIZE, seed=0):
+        self.board = BitBoard(board.rows, board.cols, board.icons)
+        self.board.board = board.board
+        self.algorithms = SearchAlgorithms(self.board.board, board.rows, board.cols)
+        self.max_nodes = max_nodes
+        self.table_size = table_size
+        grid = self.board.grid
+        self.icon_count = max((icon + 1 for icon in self.board.icon_cells), default=0)
+        rng = random.Random(seed)
+        self.zobrist = [rng.getrandbits(64) for _ in range(len(grid) * self.icon_count)]
+        self.dead = {}  # hash trạng thái bế tắc -> True, theo thứ tự thêm vào
+        self.sequence = []
+        self.stats = {'nodes': 0, 'tt_hits': 0, 'result': None}
+
+    def _key(self, i, icon):
+        return self.zobrist[i * self.icon_count + icon]
+
+    def _connectable(self, a, b):
+        position = self.board.position
+        return self.algorithms.ray_connect(position(a), position(b)) is not None
+
+    def _moves(self, known):
+        """(cặp an toàn hoặc None, các cặp nối được), icon còn ít ô được thử trước.
+
+        known: các cặp đã biết là nối được ở trạng thái cha, vẫn nối được nên khỏi kiểm tra lại.
+        """
+        moves = []
+        for icon, cells in sorted(self.board.icon_cells.items(), key=lambda item: len(item[1])):
+            cells = sorted(cells)
+            for k, a in enumerate(cells):
+                for b in cells[k + 1:]:
+                    if (a, b) in known or self._connectable(a, b):
+                        if len(cells) == 2:
+                            return (a, b), None
+                        moves.append((a, b))
+        return None, moves
+
+    def _remove(self, a, b):
+        board, grid = self.board, self.board.grid
+        icon = grid[a]
+        for i in (a, b):
+            board.set_cell(*board.position(i), EMPTY)
+        return icon
+
+    def _restore(self, a, b, icon):
+        board = self.board
+        for i in (a, b):
+            board.set_cell(*board.position(i), icon)
+
+    def _remember_dead(self, state):
+        if len(self.dead) >= self.table_size:
+            del self.dead[next(iter(self.dead))]
+        self.dead[state] = True
+
+    def _search(self, state, remaining, known=frozenset()):
+        if remaining == 0:
+            return True
+        if state in self.dead:
+            self.stats['tt_hits'] += 1
+            return False
+        if self.stats['nodes'] >= self.max_nodes:
+            self.stats['result'] = 'budget'
+            return False
+        self.stats['nodes'] += 1
+
+        safe, moves = self._moves(known)
+        known = known.union(moves) if moves else known
+        for a, b in ([safe] if safe else moves):
+            icon = self._remove(a, b)
+            self.sequence.append((a, b))
+            if self._search(state ^ self._key(a, icon) ^ self._key(b, icon), remaining - 2, known):
+                return True
+            self.sequence.pop()
+            self._restore(a, b, icon)
+            if self.stats['result'] == 'budget':
+                return False
+        self._remember_dead(state)
+        return False
+
+    def solve(self):
+        """Thứ tự xóa [((r1, c1), (r2, c2)), ...] làm sạch bảng, hoặc None.
+
+        stats['result'] là 'solved', 'unsolvable' (đã chứng minh không xóa sạch được nếu không
+        reshuffle) hoặc 'budget' (hết max_nodes trước khi kết luận).
+        """
+        board = self.board
+        state = 0
+        for icon, cells in board.icon_cells.items():
+            for i in cells:
+                state ^= self._key(i, icon)
+        remaining = sum(len(cells) for cells in board.icon_cells.values())
+        self.sequence = []
+        self.stats = {'nodes': 0, 'tt_hits': 0, 'result': None}
+        solved = self._search(state, remaining)
+        if self.stats['result'] is None:
+            self.stats['result'] = 'solved' if solved else 'unsolvable'
+        if not solved:
+            return None
+        position = board.position
+        return [(position(a), position(b)) for a, b in self.sequence]
+
+
+class BeamPlanner:
+    """Beam search trên thứ tự xóa để giảm tổng cost (tổng độ dài đường đi) của cả ván.
+
+    Mỗi tầng xóa thêm một cặp. Các trạng thái con của cả beam được chấm bằng cost đã tích lũy
+    cộng cận dưới của phần còn lại và chỉ width trạng thái tốt nhất được giữ; hai thứ tự xóa dẫn
+    tới cùng một bảng (nhận ra bằng băm Zobrist theo ô) chỉ giữ bản rẻ hơn. Cận dưới: cặp (a, b)
+    tốn ít nhất khoảng cách Manhattan từ a tới b, nên mỗi ô góp ít nhất một nửa khoảng cách tới
+    ô cùng icon gần nhất.
+    """
+
+    def __init__(self, board, width=BEAM_WIDTH, time_budget=BEAM_TIME_BUDGET, seed=0):
+        self.board = BitBoard(board.rows, board.cols, board.icons)
+        self.board.board = board.board
+        self.algorithms = SearchAlgorithms(self.board.board, board.rows, board.cols)
+        self.width = width
+        self.time_budget = time_budget
+        rng = random.Random(seed)
+        self.zobrist = [rng.getrandbits(64) for _ in range(len(self.board.grid))]
+        self.stats = {'cost': 0, 'depth': 0, 'expanded': 0, 'result': None, 'time_ms': 0}
+
+    def _bound(self, cells):
+        """Cận dưới tổng cost để xóa hết một nhóm ô cùng icon."""
+        points = [divmod(i, self.board.width) for i in cells]
+        total = 0
+        for k, (r, c) in enumerate(points):
+            total += min((abs(r - r2) + abs(c - c2) for j, (r2, c2) in enumerate(points) if j != k),
+                         default=0)
+        return total / 2
+
+    def _cost(self, board, a, b):
+        """Độ dài đường ngắn nhất (≤2 lần rẽ) nối a và b trên board, hoặc None."""
+        self.algorithms.board = board.board
+        corners = self.algorithms.ray_connect(board.position(a), board.position(b))
+        if corners is None:
+            return None
+        return sum(abs(r1 - r2) + abs(c1 - c2) for (r1, c1), (r2, c2) in zip(corners, corners[1:]))
+
+    def _moves(self, board, parent_moves=None, removed=()):
+        """{(a, b): cost hoặc None} cho mọi cặp cùng icon trên board.
+
+        Với bảng con (parent_moves của bảng cha, removed là hai ô vừa xóa), chỉ tính lại các cặp
+        có đường ≤2 lần rẽ có thể đi qua ô vừa xóa: mọi đường như vậy nằm trong dải hàng hoặc
+        dải cột giữa a và b, nên ô ngoài cả hai dải không làm đổi kết quả của cặp.
+        """
+        width = board.width
+        cleared = [divmod(i, width) for i in removed]
+        moves = {}
+        for cells in board.icon_cells.values():
+            cells = sorted(cells)
+            for k, a in enumerate(cells):
+                ra, ca = divmod(a, width)
+                for b in cells[k + 1:]:
+                    if parent_moves is not None:
+                        rb, cb = divmod(b, width)
+                        low_r, high_r = (ra, rb) if ra <= rb else (rb, ra)
+                        low_c, high_c = (ca, cb) if ca <= cb else (cb, ca)
+                        if not any(low_r <= r <= high_r or low_c <= c <= high_c for r, c in cleared):
+                            moves[a, b] = parent_moves[a, b]
+                            continue
+                    moves[a, b] = self._cost(board, a, b)
+        return moves
+
+    def plan(self):
+        """Thứ tự xóa [((r1, c1), (r2, c2)), ...] rẻ nhất tìm được.
+
+        stats['result'] là 'complete' (xóa sạch bảng), 'stuck' (mọi trạng thái trong beam đều bí)
+        hoặc 'budget' (hết time_budget); hai trường hợp sau trả về tiền tố tốt nhất đã có.
+        """
+        start_time = time.perf_counter()
+        deadline = start_time + self.time_budget
+        self.stats = {'cost': 0, 'depth': 0, 'expanded': 0, 'result': None, 'time_ms': 0}
+        root, zobrist = self.board, self.zobrist
+        state = 0
+        for cells in root.icon_cells.values():
+            for i in cells:
+                state ^= zobrist[i]
+        bounds = {icon: self._bound(cells) for icon, cells in root.icon_cells.items() if cells}
+        # mỗi phần tử: (cost đã tích lũy, thứ tự xóa, bảng, cận dưới theo icon, băm trạng thái, nước đi)
+        beam = [(0, [], root, bounds, state, self._moves(root))]
+        result = None
+        while result is None:
+            if not any(beam[0][2].icon_cells.values()):
+                result = 'complete'
+                break
+            children = {}
+            for p, (g, sequence, board, bounds, state, moves) in enumerate(beam):
+                if time.perf_counter() > deadline:
+                    result = 'budget'
+                    break
+                self.stats['expanded'] += 1
+                h = sum(bounds.values())
+                for (a, b), cost in moves.items():
+                    if cost is None:
+                        continue
+                    icon = board.grid[a]
+                    rest = [i for i in board.icon_cells[icon] if i != a and i != b]
+                    icon_bound = self._bound(rest) if rest else 0
+                    child_g = g + cost
+                    child_state = state ^ zobrist[a] ^ zobrist[b]
+                    old = children.get(child_state)
+                    if old is None or child_g < old[1]:
+                        f = child_g + h - bounds[icon] + icon_bound
+                        children[child_state] = (f, child_g, p, a, b, icon, icon_bound)
+            if result is None and not children:
+                result = 'stuck'
+            if result is not None:
+                break
+            selected = heapq.nsmallest(self.width, children.items(), key=lambda item: item[1][:2])
+            next_beam = []
+            for child_state, (f, child_g, p, a, b, icon, icon_bound) in selected:
+                _, sequence, board, bounds, _, moves = beam[p]
+                child = BitBoard(root.rows, root.cols, root.icons)
+                child.board = board.board
+                child.remove_pair(*board.position(a), *board.position(b))
+                child_bounds = dict(bounds)
+                child_bounds[icon] = icon_bound
+                next_beam.append((child_g, sequence + [(a, b)], child, child_bounds, child_state,
+                                  self._moves(child, moves, (a, b))))
+            beam = next_beam
+
+        g, sequence = beam[0][:2]
+        if result == 'complete':
+            g, sequence = min((entry[:2] for entry in beam), key=lambda entry: entry[0])
+        self.stats.update(cost=g, depth=len(sequence), result=result,
+                          time_ms=(time.perf_counter() - start_time) * 1000)
+        position = root.position
+        return [(position(a), position(b)) for a, b in sequence]
+
+
+def make_plan(board, planner="Beam"):
+    """Thứ tự xóa sạch board: "Beam" = BeamPlanner (dùng Solver nếu beam không xóa sạch được bảng
+    trong giới hạn thời gian), "Solver" = chỉ Solver; [] nếu không tìm được."""
+    if planner == "Beam":
+        beam = BeamPlanner(board)
+        plan = beam.plan()
+        if beam.stats['result'] == 'complete':
+            return plan
+    return Solver(board).solve() or []
+
+
+class PlanWorker:
+    """Chạy make_plan trong một luồng nền trên bản chụp của Board, để luồng giao diện không bị chặn.
+
+    request() chụp bảng rồi lập kế hoạch ở nền (bỏ qua nếu đang có luồng làm việc đó); take() trả
+    về kế hoạch khi luồng đã xong, None khi chưa có. Bảng có thể đã bị xóa thêm vài cặp trong lúc
+    lập: các cặp đó được bỏ khỏi kế hoạch nếu chính là cặp trong kế hoạch (xóa ô chỉ làm bảng
+    trống thêm nên phần còn lại vẫn đi được), còn không thì kế hoạch bị bỏ để lập lại.
+    """
+
+    def __init__(self, planner="Beam"):
+        self.planner = planner
+        self.lock = threading.Lock()
+        self.running = False
+        self.done = None  # (generation, số ô đã xóa lúc chụp, kế hoạch) của lần lập vừa xong
+
+    def request(self, board):
+        """Lập kế hoạch cho bảng hiện tại của board trong một luồng nền; None nếu đang có luồng chạy."""
+        with self.lock:
+            if self.running:
+                return None
+            self.running = True
+            self.done = None
+        snapshot = Board(board.rows, board.cols, board.icons)
+        snapshot.board = board.board
+        worker = threading.Thread(target=self._plan, daemon=True,
+                                  args=(snapshot, board.generation, len(board.removed)))
+        worker.start()
+        return worker
+
+    def _plan(self, snapshot, generation, removed):
+        plan = []
+        try:
+            plan = make_plan(snapshot, self.planner)
+        finally:
+            with self.lock:
+                self.done = (generation, removed, plan)
+                self.running = False
+
+    def take(self, board):
+        """deque các cặp còn lại của kế hoạch lập cho board, hoặc None nếu chưa có / không còn dùng được."""
+        with self.lock:
+            done, self.done = self.done, None
+        if done is None:
+            return None
+        generation, removed, plan = done
+        if generation != board.generation:
+            return None
+        position = board.position
+        cleared = board.removed[removed:]
+        extra = {frozenset((position(a), position(b))) for a, b in zip(cleared[::2], cleared[1::2])}
+        rest = deque(pair for pair in plan if frozenset(pair) not in extra)
+        if len(rest) != len(plan) - len(extra):
+            return None  # bảng đã xóa một cặp không có trong kế hoạch
+        return rest
@@ -142,7 +142,7 @@ class GameUI:
         # Algorithm selection with rounded background
         self.algo_var = tk.StringVar(value="DFS")
         self.algo_menu = ttk.Combobox(self.bg_canvas, textvariable=self.algo_var,
-                                      values=["DFS", "BFS", "UCS", "A*", "HillClimb"], state="readonly", width=10, style="Rounded.TCombobox")
+                                      values=["DFS", "BFS", "UCS", "A*", "HillClimb", "Ray", "0-1 BFS", "Batch", "Bi-BFS", "Segments"], state="readonly", width=10, style="Rounded.TCombobox")
         self.algo_menu_window = self.bg_canvas.create_window(630, 12, window=self.algo_menu, anchor="nw")
         
         # Add framed selector panel for Algorithm (arcade style)